@@ -0,0 +1,100 @@
+"""
+Benchmarks for the PN532 driver. Run from the REPL on the Pico (with main.py
+stopped):
+
+    import benchmarks
+    benchmarks.run()
+"""
+
+import gc
+import time
+from machine import Pin, SPI
+from micropython import const
+import NFC_PN532 as nfc
+
+_COMMAND_GETFIRMWAREVERSION = const(0x02)
+
+
+def make_device():
+    """Create a PN532 on the wiring used by main.py, set up as main.py
+    does."""
+    spi = SPI(0, baudrate=1152000, polarity=0, phase=0, bits=8,
+              firstbit=SPI.MSB, sck=Pin(18), mosi=Pin(19), miso=Pin(16))
+    cs = Pin(17, Pin.OUT)
+    cs.value(1)
+    dev = nfc.PN532(spi, cs, irq=Pin(15, Pin.IN, Pin.PULL_UP),
+                    reset=Pin(20, Pin.OUT))
+    # After the reset the PN532 stays in LowVbat mode, where it finds no
+    # cards, until the SAM is configured.
+    dev.SAM_configuration()
+    return dev
+
+
+def command_allocations(dev, rounds=50):
+    """Return the average number of heap bytes allocated by one call_function
+    round trip (GetFirmwareVersion)."""
+    dev.call_function(_COMMAND_GETFIRMWAREVERSION, 4)  # warm up
+    gc.collect()
+    gc.disable()  # a collection mid-run would hide allocations
+    try:
+        before = gc.mem_alloc()
+        for _ in range(rounds):
+            dev.call_function(_COMMAND_GETFIRMWAREVERSION, 4)
+        after = gc.mem_alloc()
+    finally:
+        gc.enable()
+    return (after - before) / rounds
+
+
+def command_latency(dev, rounds=50):
+    """Return the average milliseconds per call_function round trip and the
+    transport statistics (transactions, total us, us per transaction)."""
+    dev.transport_stats(reset=True)
+    start = time.ticks_us()
+    for _ in range(rounds):
+        dev.call_function(_COMMAND_GETFIRMWAREVERSION, 4)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    return elapsed / rounds / 1000, dev.transport_stats(reset=True)
+
+
+def bitrate_throughput(dev, rounds=5):
+    """Read the NDEF message of the Type 4 tag in the field at each bit rate
+    the tag takes and return (kbps, bytes per second) pairs, or an empty list
+    if there is no Type 4 tag with an NDEF message in the field. The rate
+    can only change right after the tag is selected, so the field is cycled
+    before each one."""
+    results = []
+    buf = bytearray(4096)
+    targets = dev.list_targets(1)
+    if not targets:
+        return results
+    for rate in range(targets[0].max_bitrate() + 1):
+        dev.rf_field(False)
+        time.sleep_ms(10)
+        if not dev.list_targets(1) or (rate and not dev.set_bitrate(rate)):
+            break
+        start = time.ticks_us()
+        total = 0
+        for _ in range(rounds):
+            message = dev.type4_read_ndef(buf)
+            if message is None:
+                return results
+            total += len(message)
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        results.append((nfc.BITRATE_KBPS[rate], total * 1000000 // elapsed))
+    return results
+
+
+def run(dev=None):
+    if dev is None:
+        dev = make_device()
+    print("Heap bytes per command: {:.1f}".format(command_allocations(dev)))
+    ms, (count, total, average) = command_latency(dev)
+    print("Round trip: {:.2f} ms, {} SPI transactions, {} us each".format(
+        ms, count, average))
+    rates = bitrate_throughput(dev)
+    if not rates:
+        print("Type 4 NDEF throughput: skipped, no Type 4 tag in the field")
+    for kbps, rate in rates:
+        print("Type 4 NDEF read at {} kbps: {} bytes/s".format(kbps, rate))
+    dev.dump_stats()
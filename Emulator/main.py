@@ -1,10 +1,15 @@
-from machine import Pin, SPI, I2C
+from machine import Pin, SPI, I2C, lightsleep
 import NFC_PN532 as nfc
+from nfc_worker import NFCWorker
+from record_store import RecordStore
+from uid_library import UIDLibrary, mifare_uid, ntag_uid, SAVED_NEW, SAVED_UPDATED
 from ssd1306 import SSD1306_I2C
 import time
-import ujson
 import os
 
+# Boot-to-ready time is measured from here
+boot_start = time.ticks_ms()
+
 # ==== I2C setup ====
 i2c = I2C(1, scl=Pin(3), sda=Pin(2))  # I2C1 uses GP2 (SDA) and GP3 (SCL)
 
@@ -28,35 +33,72 @@ cs = Pin(17, Pin.OUT)
 cs.value(1)
 rst = Pin(20, Pin.OUT)
 rst.value(1)
-# IRQ pin is not used in this library's polling mode
-# irq = Pin(15, Pin.IN) 
-irq = None # Set to None
+# The PN532 pulls IRQ low when a response is ready, so the driver can sleep
+# instead of polling the bus. Set irq = None if GP15 is not wired.
+irq = Pin(15, Pin.IN, Pin.PULL_UP)
 # Initialize GPIO pins for the buttons.
 # We are using internal pull-ups, so the buttons should be wired
 # to connect the pin to ground when pressed.
 up_button = Pin(14, Pin.IN, Pin.PULL_UP)
 sel_button = Pin(13, Pin.IN, Pin.PULL_UP)
 down_button = Pin(5, Pin.IN, Pin.PULL_UP)
+# A button edge wakes the Pico from lightsleep; the press itself is still
+# read by polling in the main loop.
+for button in (up_button, sel_button, down_button):
+    button.irq(trigger=Pin.IRQ_FALLING, handler=lambda pin: None)
+
+# --- Power management ---
+# While idle the Pico light-sleeps for up to IDLE_SLEEP_MS at a time and the
+# NFC worker keeps the PN532 powered down with the RF field off. The share
+# of time spent awake is printed every DUTY_REPORT_MS.
+IDLE_SLEEP_MS = 100
+DUTY_REPORT_MS = 60000
+
+# How often to look again while only cards that already carry the UID
+# being cloned are on the reader
+CLONE_POLL_MS = 100
 
 
 # menus
 mainMenu = [" ", "Mifare Classic", "NTAG", "Clear Saved", " "]
-mifareMenu = [" ", "..", "Mifare Read", "Write current", "Save current", "Load from saved", " "]
+mifareMenu = [" ", "..", "Mifare Read", "Write current", "Save current", "Load from saved", "Dump card", "Batch clone", " "]
 ntagMenu = [" ", "..", "NTAG read", "Write current", "Save current", "Load from saved", " "]
 
-# saved data
-MIFARE_FILE = "saved_mifare.json"
-NTAG_FILE = "saved_ntag.json"
-savedUIDsMifare = []
-savedUIDsNTAG = []
+# saved data: MIFARE block 0s and NTAG pages 0-3, one 16-byte record each,
+# at most one per UID. Lists saved as JSON by older firmware are moved over
+# on the first boot.
+MIFARE_FILE = "saved_mifare.bin"
+NTAG_FILE = "saved_ntag.bin"
+
+def open_saved(filename, old_file, uid_of):
+    store = RecordStore(filename)
+    moved = store.migrate_json(old_file)
+    if moved:
+        print(f"Moved {moved} items from {old_file} to {filename}")
+    return UIDLibrary(store, uid_of)
+
+savedMifare = open_saved(MIFARE_FILE, "saved_mifare.json", mifare_uid)
+savedNTAG = open_saved(NTAG_FILE, "saved_ntag.json", ntag_uid)
 saved_block_0 = None
+saved_ntag_dump = None
 
 # --- PN532 Initialization ---
+# The PN532 is brought up by the worker's boot job, so the menu is on the
+# screen while it starts.
 print("Initializing PN532...")
-pn532 = nfc.PN532(spi, cs, rst, irq)
-ic, ver, rev, support = pn532.get_firmware_version()
-print('Found PN532 with firmware version: {}.{}'.format(ver, rev))
-pn532.SAM_configuration()
+pn532 = nfc.PN532(spi, cs, irq=irq, reset=rst, init=False)
+
+def start_pn532(job):
+    """
+    Boot job: wakes the PN532, waits for it to answer and configures the SAM.
+    Returns the firmware version.
+    """
+    job.dev.begin()
+    job.dev.SAM_configuration()
+    return job.dev.firmware_version
+
+# All card operations run on core 1 so buttons and the OLED stay responsive
+worker = NFCWorker(pn532, boot=start_pn532)
 
 # initialize screen and menu
 currentMenu = mainMenu
@@ -65,168 +107,343 @@ driverSelection = None
 
 def calculate_bcc(uid_bytes):
     """
-    Calculates the BCC (XOR checksum) for a 4-byte MIFARE UID.
+    Calculates the BCC (XOR checksum) of every cascade level of a 4, 7 or
+    10-byte MIFARE UID, as the card sends them during anticollision. Every
+    level but the last is the cascade tag 0x88 and 3 UID bytes.
+    Returns a bytearray with one BCC per level.
     """
-    if len(uid_bytes) != 4:
-        raise ValueError("UID must be 4 bytes long")
-    bcc = 0
-    for byte in uid_bytes:
-        bcc ^= byte
-    return bcc
+    if len(uid_bytes) not in (4, 7, 10):
+        raise ValueError("UID must be 4, 7 or 10 bytes long")
+    bccs = bytearray(len(uid_bytes) // 3)
+    last = len(bccs) - 1
+    for level in range(len(bccs)):
+        if level < last:
+            bcc = 0x88
+            part = uid_bytes[3 * level:3 * level + 3]
+        else:
+            bcc = 0
+            part = uid_bytes[3 * level:]
+        for byte in part:
+            bcc ^= byte
+        bccs[level] = bcc
+    return bccs
 
 
-def read_source_card_data(dev, timeout_ms=5000):
+def read_source_card_data(job, timeout_ms=5000):
     """
     Waits for a source card, authenticates block 0, validates its BCC, 
     and reads the 16-byte block.
     Returns the 16 bytes of block 0, or None if it fails.
     """
+    dev = job.dev
     print('Waiting for SOURCE card...')
-    oled_print("Waiting for SOURCE card...", clear=True)
+    job.progress("Waiting for SOURCE card...")
     print('Present the card you want to CLONE.')
-    start = time.ticks_ms()
-    uid = None
-    while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
-        # Check for a card
-        uid = dev.read_passive_target(timeout=100)
-        if uid is not None:
-            # Card found, break out of the loop
-            break
-        time.sleep(0.1)
+    # The PN532 polls for the card itself and answers as soon as one is tapped
+    uid = job.wait_for_card(timeout_ms)
 
     if not uid:
         print('CARD NOT FOUND')
-        oled_print("CARD NOT FOUND", clear=True)
+        job.progress("CARD NOT FOUND")
         return None
         
     uid_string = "".join(["{:02X}".format(i) for i in uid])
-    print(f"Found source card with UID: {uid_string}")
-    oled_print(f"Found:\n{uid_string}", clear=True)
+    family, caps = dev.card_info()
+    print(f"Found source card with UID: {uid_string} ({nfc.CARD_NAMES[family]})")
+    job.progress(f"Found:\n{uid_string}")
+
+    # Only a 4-byte UID MIFARE Classic can be cloned onto the magic cards, so
+    # don't spend round trips authenticating anything else.
+    if family != nfc.CARD_UNKNOWN and not caps & nfc.CAP_CLASSIC:
+        print(f"{nfc.CARD_NAMES[family]} found, not a MIFARE Classic. Nothing to clone.")
+        job.progress(f"Not a Classic:\n{nfc.CARD_NAMES[family]}")
+        return None
+    if len(uid) != 4:
+        bccs = " ".join(["{:02X}".format(b) for b in calculate_bcc(uid)])
+        print(f"{len(uid)}-byte UID (cascade BCCs {bccs}) can't be cloned onto a 4-byte magic card.")
+        job.progress(f"{len(uid)}-byte UID\ncan't be cloned")
+        return None
 
     # Authenticate block 0 (or any block in sector 0) to read it.
     # We'll try a common default key, KEY_DEFAULT_B (all 0xFFs)
     print("Trying to authenticate with default key FF FF FF FF FF FF...")
-    oled_print("Authenticating\nsource card...", clear=False)
+    job.progress("Authenticating\nsource card...")
     if not dev.mifare_classic_authenticate_block(uid, 0, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B):
         print("Failed to authenticate block 0 with default key.")
         print("Note: Card must use the default key FF FF FF FF FF FF for this to work.")
-        oled_print("Authentication\nfailed!", clear=True)
+        job.progress("Authentication\nfailed!")
         return None
     
     print("Authentication successful.")
-    oled_print("Authentication\nsuccessful!", clear=True)
+    job.progress("Authentication\nsuccessful!")
     
     # Read block 0
     block0_data = dev.mifare_classic_read_block(0)
     
     if not block0_data:
         print("Failed to read block 0.")
-        oled_print("Read Block 0\nfailed!", clear=True)
-        time.sleep(1)
+        job.progress("Read Block 0\nfailed!")
         return None
 
     print(f"Successfully read Block 0: {[hex(b) for b in block0_data]}")
-    oled_print("Read Block 0\nsuccessful!", clear=True)
-    time.sleep(1)
+    job.progress("Read Block 0\nsuccessful!")
 
     # --- BCC SAFETY CHECK ---
     print("Validating source card BCC...")
-    oled_print("Validating\nsource card BCC...", clear=True)
+    job.progress("Validating\nsource card BCC...")
     card_uid_part = block0_data[0:4]
     card_bcc_part = block0_data[4]
     
-    calculated_bcc = calculate_bcc(card_uid_part)
+    calculated_bcc = calculate_bcc(card_uid_part)[0]
     
     if card_bcc_part == calculated_bcc:
         print(f"BCC is valid! (Read: 0x{card_bcc_part:02X}, Calculated: 0x{calculated_bcc:02X})")
-        oled_print("BCC VALIDATION\nSUCCESS!", clear=True)
-        time.sleep(0.5)
-        oled_print("Block 0 Data:\n" + "".join(["{:02X}".format(b) for b in block0_data]), clear=True)
-        time.sleep(3)
+        job.progress("BCC VALIDATION\nSUCCESS!")
+        job.progress("Block 0 Data:\n" + "".join(["{:02X}".format(b) for b in block0_data]))
         return block0_data
     else:
         print("--- !!! BCC VALIDATION FAILED !!! ---")
-        oled_print("!!! BCC VALIDATION\nFAILED !!!", clear=True)
+        job.progress("!!! BCC VALIDATION\nFAILED !!!")
         print(f"Read UID: {[hex(b) for b in card_uid_part]}")
         print(f"Read BCC: 0x{card_bcc_part:02X}")
         print(f"Calculated BCC: 0x{calculated_bcc:02X}")
         print("This card may be damaged or non-standard. Aborting clone to prevent bricking.")
-        time.sleep(0.5)
         return None
     # --- END OF BCC CHECK ---
 
 
-def write_data_to_clone(dev, block_data, timeout_ms=10000):
+def wait_for_clone_target(job, clone_uid, timeout_ms):
+    """
+    Waits for a card to write clone_uid to and selects it. Cards that already
+    carry clone_uid (the source card left on the reader, or one written
+    earlier) are passed over, so with two cards in the field the other one
+    is used. Returns the UID of the card, or None on timeout or cancel.
+    """
+    dev = job.dev
+    start = time.ticks_ms()
+    while not job.cancelled:
+        remaining = timeout_ms - time.ticks_diff(time.ticks_ms(), start)
+        if remaining <= 0 or job.wait_for_card(remaining) is None:
+            break
+        targets = dev.list_targets()
+        for target in targets:
+            if target.uid != clone_uid:
+                if len(targets) > 1:
+                    print(f"{len(targets)} cards in the field, using target {target.tg}")
+                    dev.select_target(target)
+                return target.uid
+        time.sleep_ms(CLONE_POLL_MS)
+    return None
+
+
+def write_data_to_clone(job, block_data, timeout_ms=10000):
     """
     Waits for a programmable card and writes the saved block 0 data to it.
     This requires a special UID-modifiable card.
     """
+    dev = job.dev
     print("Waiting for TARGET card...")
-    oled_print("Waiting for TARGET card...", clear=True)
+    job.progress("Waiting for TARGET card...")
     print("Present your UID-MODIFIABLE (magic) card.")
 
     # Wait for a target card to appear
-    start_wait = time.ticks_ms()
-    target_uid = None
-    while time.ticks_diff(time.ticks_ms(), start_wait) < timeout_ms:
-        target_uid = dev.read_passive_target(timeout=100)
-        if target_uid is not None:
-            break
-        time.sleep(0.1)
+    target_uid = wait_for_clone_target(job, bytearray(block_data[0:4]), timeout_ms)
 
     if not target_uid:
         print("No target card found to write to. Aborting.")
-        oled_print("No target card found.\nAborting.", clear=True)
-        return
+        job.progress("No target card found.\nAborting.")
+        return False
 
     target_uid_string = "".join(["{:02X}".format(i) for i in target_uid])
     print(f"Found target card with UID: {target_uid_string}")
-    oled_print(f"Found target card:\n{target_uid_string}", clear=True)
+    job.progress(f"Found target card:\n{target_uid_string}")
+
+    # Gen1a cards are written through their unlock backdoor, "Gen2" or
+    # "lab 401" cards with a normal authentication and write to block 0.
+    # The write is checked by selecting the card again and reading block 0
+    # back, while it is still in the field.
+    print("Writing Block 0 and verifying...")
+    job.progress("Writing to\nBlock 0...")
+    start = time.ticks_ms()
+    attempts = dev.mifare_classic_clone_block0(target_uid, block_data, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B)
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    if attempts:
+        print(f"SUCCESS! Block 0 written and verified in {elapsed} ms ({attempts} attempt(s)).")
+        print(f"Wrote data: {[hex(b) for b in block_data]}")
+        job.progress(f"Write VERIFIED!\n{elapsed} ms")
+        return True
+    print("Error: Block 0 could not be written and verified.")
+    print("Check the default key, or this may not be a Gen1a or 'Direct Write' card.")
+    job.progress("Write FAILED!")
+    return False
 
-    # For "Gen2" or "lab 401" cards, we can try a normal authentication
-    # and then a standard write command to block 0.
-    
-    print("Attempting to authenticate target card...")
-    # authenticate with the card's current key.
-    # For a blank/new magic card, this is often the default key.
-    if not dev.mifare_classic_authenticate_block(target_uid, 0, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B):
-        print("Failed to authenticate target card with default key.")
-        oled_print("Authentication\nfailed!", clear=True)
-        time.sleep(1.5)
+
+def read_ntag_data(job, timeout_ms=5000):
+    """
+    Waits for an NTAG and reads its whole memory.
+    Returns a bytearray with 4 bytes per page, or None if it fails.
+    """
+    dev = job.dev
+    print('Waiting for NTAG...')
+    job.progress("Waiting for NTAG...")
+    uid = job.wait_for_card(timeout_ms)
+    if not uid:
+        print('CARD NOT FOUND')
+        job.progress("CARD NOT FOUND")
+        return None
+
+    uid_string = "".join(["{:02X}".format(i) for i in uid])
+    print(f"Found NTAG with UID: {uid_string}")
+    job.progress(f"Found:\n{uid_string}")
+
+    family, caps = dev.card_info()
+    if family != nfc.CARD_UNKNOWN and not caps & nfc.CAP_PAGES:
+        print(f"{nfc.CARD_NAMES[family]} found, not an NTAG.")
+        job.progress(f"Not an NTAG:\n{nfc.CARD_NAMES[family]}")
+        return None
+
+    start = time.ticks_ms()
+    pages = dev.ntag2xx_dump()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    if pages is None:
+        print("Failed to read NTAG memory.")
+        job.progress("NTAG read\nfailed!")
+        return None
+
+    for page in range(len(pages) // 4):
+        print("{:03d}: {}".format(page, "".join(["{:02X}".format(b) for b in pages[page * 4:page * 4 + 4]])))
+    print(f"Read {len(pages) // 4} pages in {elapsed} ms")
+    job.progress(f"Read {len(pages) // 4} pages\nin {elapsed} ms")
+    return pages
+
+
+def dump_source_card(job, timeout_ms=5000):
+    """
+    Waits for a card and dumps all 64 blocks of a MIFARE Classic 1K to the
+    serial console, authenticating each sector with the default key.
+    """
+    dev = job.dev
+    print('Waiting for card to DUMP...')
+    job.progress("Waiting for card\nto dump...")
+    uid = job.wait_for_card(timeout_ms)
+    if not uid:
+        print('CARD NOT FOUND')
+        job.progress("CARD NOT FOUND")
         return
-        
-    print("Target card authenticated. Attempting to write to Block 0...")
-    oled_print("Writing to\nBlock 0...", clear=True)
-    
-    # Now, try to write the saved block 0 data
-    if dev.mifare_classic_write_block(0, block_data):
-        print("SUCCESS! Block 0 written.")
-        oled_print("Write SUCCESS!", clear=True)
-        print(f"Wrote data: {[hex(b) for b in block_data]}")
-        oled_print(f"Wrote data:\n{''.join(['{:02X}'.format(b) for b in block_data])}", clear=True)
-        time.sleep(1.5)
+
+    uid_string = "".join(["{:02X}".format(i) for i in uid])
+    print(f"Dumping card with UID: {uid_string}")
+    job.progress(f"Dumping:\n{uid_string}")
+
+    def print_block(block, data):
+        print("{:02d}: {}".format(block, "".join(["{:02X}".format(b) for b in data])))
+
+    start = time.ticks_ms()
+    stats = dev.dump_card(uid, print_block)
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    good = [s for s in stats if s is not None]
+    for sector, sector_stats in enumerate(stats):
+        if sector_stats is None:
+            print(f"Sector {sector}: FAILED")
+        else:
+            print(f"Sector {sector}: auth {sector_stats[0]} us, read {sector_stats[1]} us")
+    print(f"Dumped {len(good)}/{len(stats)} sectors in {elapsed} ms")
+    job.progress(f"Dumped {len(good)}/{len(stats)}\nsectors in\n{elapsed} ms")
+
+
+def batch_clone(job, block_data, poll_ms=1000):
+    """
+    Writes the saved block 0 data to one magic card after another until
+    cancelled. Each new card is written and verified. Cards that already
+    carry the saved UID (written ones, or the source card left on the
+    reader) are passed over; a card that fails has to be taken away before
+    the next one is looked for.
+    """
+    dev = job.dev
+    clone_uid = bytearray(block_data[0:4])
+    written = 0
+    failed = 0
+    start = time.ticks_ms()
+    print("Batch clone: present magic cards one at a time.")
+    job.progress("Batch clone\nPresent card...")
+    while not job.cancelled:
+        uid = wait_for_clone_target(job, clone_uid, poll_ms)
+        if uid is None:
+            continue
+        uid_string = "".join(["{:02X}".format(i) for i in uid])
+        card_start = time.ticks_ms()
+        attempts = dev.mifare_classic_clone_block0(uid, block_data, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B)
+        card_ms = time.ticks_diff(time.ticks_ms(), card_start)
+        if attempts:
+            written += 1
+            status = f"Card {written} OK"
+            print(f"Card {written}: {uid_string} written and verified in {card_ms} ms ({attempts} attempt(s))")
+        else:
+            failed += 1
+            status = "Card FAILED"
+            print(f"{uid_string}: write FAILED after {card_ms} ms")
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        per_minute = written * 60000 // elapsed if elapsed else 0
+        job.progress(f"{status}\n{written} done {failed} failed\n{per_minute} cards/min\n" + ("Next card..." if attempts else "Remove card..."))
+        # Wait for a failed card to leave the field so it isn't tried again;
+        # a written card now carries the saved UID and is passed over.
+        while not job.cancelled and uid in [t.uid for t in dev.list_targets(timeout=100)]:
+            time.sleep_ms(50)
+        job.progress(f"{written} done {failed} failed\n{per_minute} cards/min\nPresent card...")
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    print(f"Batch clone stopped: {written} written, {failed} failed in {elapsed // 1000} s")
+    return written
+
+
+def handle_event(kind, name, value):
+    """
+    Applies an event posted by the NFC worker. Runs on the UI core.
+    """
+    global saved_block_0, saved_ntag_dump
+    if kind == "progress":
+        show_message(value)
         return
-    else:
-        print("Error: Failed to write to block 0.")
-        oled_print("Write FAILED!", clear=True)
-        time.sleep(1.5) 
+    if kind == "error":
+        print(f"{name} failed: {value}")
+        show_message("Error:\n" + str(value))
         return
 
+    if name == "boot":
+        ic, ver, rev, support = value
+        print('Found PN532 with firmware version: {}.{}'.format(ver, rev))
+        print(f"PN532 up in {pn532.boot_ms} ms, ready "
+              f"{time.ticks_diff(time.ticks_ms(), boot_start)} ms after boot")
 
-def driver_select(selection):
-    global saved_block_0
-    if selection == 0: #scan mifare classic
-        scanned_data = read_source_card_data(pn532)
-    
-        if scanned_data:
-            saved_block_0 = scanned_data # Save the 16-byte block
+    elif name == "scan":
+        if value:
+            saved_block_0 = value # Save the 16-byte block
             print("Block 0 data saved.")
-            oled_print("Scan successful!\nData saved.", clear=True)
-            time.sleep(1.5)
+            if mifare_uid(value) in savedMifare:
+                print("This UID is already in the saved list.")
+                show_message("Scan successful!\nAlready saved.")
+            else:
+                show_message("Scan successful!\nData saved.")
         else:
             print("Scan failed. No data was saved.")
-            oled_print("Scan failed.\nNo data saved.", clear=True)  
-            time.sleep(1.5)
+            show_message("Scan failed.\nNo data saved.")
+
+    elif name == "ntag read":
+        if value:
+            saved_ntag_dump = value
+            print("NTAG memory saved.")
+            if ntag_uid(value[0:16]) in savedNTAG:
+                print("This UID is already in the saved list.")
+        else:
+            print("NTAG read failed. No data was saved.")
+            show_message("Scan failed.\nNo data saved.")
+
+    elif name == "batch":
+        show_message(f"Batch stopped\n{value} cards written")
+
+
+def driver_select(selection):
+    if selection == 0: #scan mifare classic
+        worker.submit("scan", read_source_card_data)
 
     elif selection == 1:#write mifare classic
         print("Writing saved Block 0 data to target card...")
@@ -238,77 +455,91 @@ def driver_select(selection):
             data_string = "".join(["{:02X}".format(i) for i in saved_block_0])
             print(f"Writing data: {data_string}")
             oled_print(f"Writing data:\n{data_string}", clear=True)
-            write_data_to_clone(pn532, saved_block_0)
+            worker.submit("write", write_data_to_clone, saved_block_0)
 
-    elif selection == 2: #save current mifare classic TODO
-        oled_print("Saving current\nMIFARE UID...", clear=True)
-        time.sleep(0.5)
-        savedUIDsMifare.append(saved_block_0)
-        save_list_to_file(savedUIDsMifare, MIFARE_FILE) 
+    elif selection == 2: #save current mifare classic
+        if saved_block_0 is None:
+            oled_print("No saved data!\nScan first.", clear=True)
+            time.sleep(1.5)
+        else:
+            oled_print("Saving current\nMIFARE UID...", clear=True)
+            time.sleep(0.5)
+            save_record(savedMifare, saved_block_0)
 
-    elif selection== 3: #display saved mifare classic uids TODO
+    elif selection== 3: #display saved mifare classic uids
         oled_print("Loading saved\nMIFARE UIDs...", clear=True)
         time.sleep(0.5)
-        savedUIDsMifare = load_list_from_file(MIFARE_FILE)
-        for index, data in enumerate(savedUIDsMifare):
-            data_string = "".join(["{:02X}".format(b) for b in data])
-            print(f"{index + 1}: {data_string}")
-            oled_print(f"{index + 1}: {data_string}")
+        show_saved(savedMifare)
 
-    elif selection == 4: 
-        oled_print("NTAG read not\nimplemented", clear=True)
-        time.sleep(1.5)
+    elif selection == 4: #read ntag
+        worker.submit("ntag read", read_ntag_data)
 
         
     elif selection == 5: 
         oled_print("NTAG write not\nimplemented", clear=True)
         time.sleep(1.5)
 
-    elif selection == 6: 
-        oled_print("Save current to\nNTAG list not\nimplemented", clear=True)
-        time.sleep(1.5)
+    elif selection == 6: #save current ntag (pages 0-3: UID, lock and CC)
+        if saved_ntag_dump is None:
+            oled_print("No saved data!\nScan first.", clear=True)
+            time.sleep(1.5)
+        else:
+            oled_print("Saving current\nNTAG UID...", clear=True)
+            time.sleep(0.5)
+            save_record(savedNTAG, saved_ntag_dump[0:16])
 
-    elif selection == 7: 
-        oled_print("Display saved\nNTAG UIDs not\nimplemented", clear=True)
-        time.sleep(1.5)
+    elif selection == 7: #display saved ntag uids
+        oled_print("Loading saved\nNTAG UIDs...", clear=True)
+        time.sleep(0.5)
+        show_saved(savedNTAG)
+
+    elif selection == 8: #dump mifare classic
+        worker.submit("dump", dump_source_card)
+
+    elif selection == 9: #batch clone saved mifare classic block 0
+        if saved_block_0 is None:
+            print("Error: No data has been saved from a source card.")
+            oled_print("No saved data!\nScan first.", clear=True)
+            time.sleep(1.5)
+        else:
+            worker.submit("batch", batch_clone, saved_block_0)
 
     else: pass  # no action
 
 # --- Save function ---
-def save_list_to_file(data_list, filename):
+def save_record(library, block):
     try:
-        with open(filename, "w") as f:
-            ujson.dump(data_list, f)
-        print(f"Saved {len(data_list)} items to {filename}")
-        oled_print(f"Saved {len(data_list)} items", clear=True)
+        result = library.save(block)
+        if result == SAVED_NEW:
+            print(f"Saved {len(library)} items to {library.store.path}")
+            oled_print(f"Saved {len(library)} items", clear=True)
+        elif result == SAVED_UPDATED:
+            print(f"UID already saved, updated its data in {library.store.path}")
+            oled_print("UID already\nsaved, updated", clear=True)
+        else:
+            print("UID already saved with the same data, nothing written")
+            oled_print("Already saved", clear=True)
     except Exception as e:
         print("Error saving file:", e)
         oled_print("Error saving file", clear=True)
-    
-    return
 
 # --- Load function ---
-def load_list_from_file(filename):
+def show_saved(library):
     try:
-        with open(filename, "r") as f:
-            data = ujson.load(f)
-        print(f"Loaded {len(data)} items from {filename}")
-        return data
+        for index, block in enumerate(library.items()):
+            data_string = "".join(["{:02X}".format(b) for b in block])
+            print(f"{index + 1}: {data_string}")
+            oled_print(f"{index + 1}: {data_string}")
+        print(f"Loaded {len(library)} items from {library.store.path}")
     except Exception as e:
         print("Error loading file:", e)
         oled_print("Error loading file", clear=True)
-        return []
-    
-# --- Clear saved function ---    
-def clear_saved_list(list_variable, filename):
-    # Clear the in-memory list
-    list_variable.clear()
-    
-    # Overwrite the JSON file with an empty list
+
+# --- Clear saved function ---
+def clear_saved(library):
     try:
-        with open(filename, "w") as f:
-            ujson.dump([], f)
-        print(f"Cleared {filename} and emptied the list.")
+        library.clear()
+        print(f"Cleared {library.store.path}.")
         oled_print(f"Cleared saved\nitems!", clear=True)
     except Exception as e:
         print("Error clearing saved file:", e)
@@ -335,6 +566,52 @@ def oled_print(*args, sep=" ", end="\n", clear=True):
 
     oled.show()
 
+def show_message(text, hold_ms=1500):
+    """
+    Shows a message on the OLED. The main loop goes back to the menu once
+    hold_ms has passed and the NFC worker is idle.
+    """
+    global message_until
+    oled_print(text, clear=True)
+    message_until = time.ticks_add(time.ticks_ms(), hold_ms)
+
+def idle_sleep(ms):
+    """
+    Sleeps until a button is pressed or ms have passed, using lightsleep
+    where the port allows it, and counts the time slept.
+    """
+    global asleep_ms, use_lightsleep
+    start = time.ticks_ms()
+    if use_lightsleep:
+        try:
+            lightsleep(ms)
+        except Exception as e:
+            print("lightsleep unavailable, idling instead:", e)
+            use_lightsleep = False
+    if not use_lightsleep:
+        time.sleep_ms(ms)
+    asleep_ms += time.ticks_diff(time.ticks_ms(), start)
+
+def report_duty_cycle():
+    """
+    Prints the share of time the Pico and the PN532 were awake since the
+    last report, then starts counting afresh. The PN532 belongs to the
+    worker, so the report waits while a job is using it.
+    """
+    global asleep_ms, duty_start
+    total = time.ticks_diff(time.ticks_ms(), duty_start)
+    if total <= 0:
+        return
+    ok, stats = worker.try_dev(lambda dev: dev.power_stats(reset=True))
+    if not ok:
+        return
+    power_downs, down_ms = stats
+    print(f"Duty cycle: Pico awake {(total - asleep_ms) * 100 // total}%, "
+          f"PN532 awake {max(0, total - down_ms) * 100 // total}% "
+          f"({power_downs} power downs in {total // 1000} s)")
+    asleep_ms = 0
+    duty_start = time.ticks_ms()
+
 def printMenu(menu, index):
     # Clamp the index inside valid range
     if index <= 0:
@@ -355,11 +632,35 @@ def printMenu(menu, index):
 currentMenu = mainMenu
 currentOptionIndex = 1
 driverSelection = None
+message_until = None
+use_lightsleep = True
+asleep_ms = 0
+duty_start = time.ticks_ms()
 
 printMenu(currentMenu, currentOptionIndex)
 
 while True:
 
+    if time.ticks_diff(time.ticks_ms(), duty_start) >= DUTY_REPORT_MS:
+        report_duty_cycle()
+
+    for kind, name, value in worker.events():
+        handle_event(kind, name, value)
+
+    if worker.busy:
+        # Only cancel is available while a card operation runs
+        if sel_button.value() == 0:
+            time.sleep(0.2)  # Debounce delay
+            print("Cancelling...")
+            oled_print("Cancelling...", clear=True)
+            worker.cancel()
+        time.sleep(0.02)
+        continue
+
+    if message_until is not None and time.ticks_diff(time.ticks_ms(), message_until) >= 0:
+        message_until = None
+        currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
+
     if up_button.value() == 0:  # up
         time.sleep(0.2)  # Debounce delay
         if currentOptionIndex > 1:
@@ -382,8 +683,8 @@ while True:
                 currentMenu = ntagMenu
                 currentOptionIndex = 2
             elif currentOptionIndex == 3:  # Clear Saved
-                clear_saved_list(savedUIDsMifare, MIFARE_FILE)
-                clear_saved_list(savedUIDsNTAG, NTAG_FILE)
+                clear_saved(savedMifare)
+                clear_saved(savedNTAG)
             currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
 
         elif currentMenu == mifareMenu:
@@ -399,10 +700,15 @@ while True:
                 driverSelection = 2
             elif currentOptionIndex == 5:
                 driverSelection = 3
+            elif currentOptionIndex == 6:
+                driverSelection = 8
+            elif currentOptionIndex == 7:
+                driverSelection = 9
             if driverSelection is not None:
                 driver_select(driverSelection)
                 driverSelection = None
-            currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
+            if not worker.busy:
+                currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
 
         elif currentMenu == ntagMenu:
             if currentOptionIndex == 1: #go back
@@ -420,8 +726,9 @@ while True:
             if driverSelection is not None:
                 driver_select(driverSelection)
                 driverSelection = None
-            currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
+            if not worker.busy:
+                currentOptionIndex = printMenu(currentMenu, currentOptionIndex)
 
     else:
-        # invalid key
-        pass
+        # nothing pressed
+        idle_sleep(IDLE_SLEEP_MS)
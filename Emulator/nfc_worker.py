@@ -0,0 +1,153 @@
+"""
+Runs PN532 card operations on the Pico's second core.
+
+The UI loop on core 0 submits jobs and polls for events; a thread on core 1
+runs the jobs one at a time. Jobs are plain functions called as
+job(worker, *args). They talk to the card through worker.dev, report what
+they are doing with worker.progress() and should wait for cards with
+worker.wait_for_card() so a cancel request is noticed quickly.
+
+A boot job passed to the constructor runs before anything else, under the
+name "boot"; it is how the PN532 is brought up without holding up core 0.
+
+Once the queue runs dry the worker switches the RF field off and powers the
+PN532 down (unless created with standby=False); the next job's first command
+wakes it again. The worker thread itself blocks on a lock while idle.
+
+Events are (kind, name, value) tuples, where name is the name the job was
+submitted under and kind is one of:
+    "progress"  value is a status message from the job
+    "done"      value is whatever the job returned
+    "error"     value is the exception the job raised
+"""
+
+import _thread
+import time
+from micropython import const
+
+# How long a single wait_for_card slice may block before checking for cancel
+_CANCEL_SLICE_MS = const(200)
+# Core 1 stack; the PN532 call chain is a few frames deeper than the default
+_STACK_SIZE = const(8192)
+
+
+class NFCWorker:
+    """Job queue served by a thread on core 1. dev is the PN532 driver that
+    jobs use; it must not be touched from core 0 while the worker runs,
+    other than through try_dev."""
+
+    def __init__(self, dev, standby=True, boot=None):
+        self.dev = dev
+        self.busy = boot is not None
+        self.standby = standby
+        self._lock = _thread.allocate_lock()
+        # Held while there is nothing to do; submit releases it to wake core 1
+        self._kick = _thread.allocate_lock()
+        self._kick.acquire()
+        # Held by core 1 while a job or standby uses dev
+        self._dev_lock = _thread.allocate_lock()
+        self._jobs = [] if boot is None else [("boot", boot, ())]
+        self._events = []
+        self._current = None
+        self._cancel = False
+        try:
+            _thread.stack_size(_STACK_SIZE)
+        except (AttributeError, ValueError):
+            pass
+        _thread.start_new_thread(self._run, ())
+
+    # --- core 0 side ---
+    def submit(self, name, job, *args):
+        """Queue job(worker, *args) to run on core 1."""
+        with self._lock:
+            self._jobs.append((name, job, args))
+            self.busy = True
+        if self._kick.locked():
+            self._kick.release()
+
+    def cancel(self):
+        """Ask the running job to stop and drop any queued jobs."""
+        with self._lock:
+            self._jobs.clear()
+            self._cancel = True
+
+    def events(self):
+        """Return the events posted since the last call, oldest first."""
+        with self._lock:
+            events = self._events
+            self._events = []
+        return events
+
+    def try_dev(self, func, *args):
+        """Call func(dev, *args) on core 0 if the worker isn't using the
+        driver at that moment, for quick reads such as dev.power_stats().
+        Returns (True, result), or (False, None) without waiting if the
+        driver is busy."""
+        if not self._dev_lock.acquire(0):
+            return False, None
+        try:
+            return True, func(self.dev, *args)
+        finally:
+            self._dev_lock.release()
+
+    # --- core 1 side, for jobs ---
+    @property
+    def cancelled(self):
+        return self._cancel
+
+    def progress(self, message):
+        """Post a status message for the UI."""
+        self._post("progress", self._current, message)
+
+    def wait_for_card(self, timeout_ms):
+        """Wait up to timeout_ms for a card and return its UID, or None if
+        none turned up or the job was cancelled."""
+        start = time.ticks_ms()
+        while not self._cancel:
+            remaining = timeout_ms - time.ticks_diff(time.ticks_ms(), start)
+            if remaining <= 0:
+                break
+            uid = self.dev.wait_for_card(timeout=min(remaining, _CANCEL_SLICE_MS))
+            if uid is not None:
+                return uid
+        return None
+
+    def _post(self, kind, name, value):
+        with self._lock:
+            self._events.append((kind, name, value))
+
+    def _run(self):
+        asleep = False
+        while True:
+            job = None
+            to_standby = self.standby and not asleep
+            with self._lock:
+                if self._jobs:
+                    job = self._jobs.pop(0)
+                    # Under the lock, so a cancel() from now on reaches the job
+                    self._cancel = False
+                elif not to_standby:
+                    # Only once standby is done, so core 0 doesn't take the
+                    # worker for idle (and sleep) while dev is still busy
+                    self.busy = False
+            if job is None:
+                if to_standby:
+                    with self._dev_lock:
+                        try:
+                            self.dev.standby()
+                        except Exception as e:  # pylint: disable=broad-except
+                            print("PN532 standby failed:", e)
+                    asleep = True
+                    continue  # pick up a job queued meanwhile, or go idle
+                self._kick.acquire()
+                continue
+            asleep = False
+            name, func, args = job
+            self._current = name
+            try:
+                with self._dev_lock:
+                    result = func(self, *args)
+            except Exception as e:  # pylint: disable=broad-except
+                self._post("error", name, e)
+            else:
+                self._post("done", name, result)
@@ -0,0 +1,198 @@
+"""
+Append-only store of 16-byte blocks on the Pico's flash.
+
+Each record is a fixed 20 bytes:
+    0       0x5A, marks the start of a record
+    1       flags
+    2-17    the block (MIFARE block 0, or NTAG pages 0-3)
+    18-19   CRC-16/CCITT of bytes 0-17, little endian
+
+Saving a block appends one record, so it costs the same however many are
+stored, and record n is found by seeking to n * 20. A record cut short by a
+power loss is dropped the next time the store is opened; one that fails its
+CRC reads back as None. Whole-file rewrites go to a scratch file that is
+renamed over the old one, which littlefs does atomically.
+
+Lists saved by older firmware as JSON are brought in once with migrate_json.
+"""
+
+import os
+import ujson
+from micropython import const
+
+RECORD_SIZE = const(20)
+BLOCK_SIZE = const(16)
+# Set on records brought in from a JSON list by migrate_json
+FLAG_MIGRATED = const(0x01)
+# Set on a record that withdraws an earlier one (see uid_library)
+FLAG_DELETED = const(0x02)
+
+_MARKER = const(0x5A)
+_CRC_OFFSET = const(18)
+# Suffix of the scratch file a rewrite goes to
+_SCRATCH = ".tmp"
+# Suffix a JSON list that can't be read is kept under by migrate_json
+_UNREADABLE = ".bad"
+
+
+def _crc16(buf, count):
+    """CRC-16/CCITT (poly 0x1021, init 0xFFFF) of the first count bytes."""
+    crc = 0xFFFF
+    for i in range(count):
+        crc ^= buf[i] << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+def _pack(record, flags, block):
+    """Fill the record buffer with block, flags, marker and CRC."""
+    record[0] = _MARKER
+    record[1] = flags
+    record[2:_CRC_OFFSET] = block
+    crc = _crc16(record, _CRC_OFFSET)
+    record[_CRC_OFFSET] = crc & 0xFF
+    record[_CRC_OFFSET + 1] = crc >> 8
+
+
+def _intact(record):
+    """True if record has its marker and a matching CRC."""
+    return record[0] == _MARKER and _crc16(record, _CRC_OFFSET) == (
+        record[_CRC_OFFSET] | record[_CRC_OFFSET + 1] << 8)
+
+
+def _parse_block(entry):
+    """Return an entry of a JSON list (hex string or list of byte values) as
+    bytes, or None if it isn't a 16-byte block."""
+    try:
+        if isinstance(entry, str):
+            block = bytes.fromhex(entry)
+        elif isinstance(entry, list):
+            block = bytes(entry)
+        else:
+            return None
+    except (ValueError, TypeError):
+        return None
+    return block if len(block) == BLOCK_SIZE else None
+
+
+class RecordStore:
+    """Fixed-size record log in the file at path, created if missing."""
+
+    def __init__(self, path):
+        self.path = path
+        self._record = bytearray(RECORD_SIZE)
+        try:
+            size = os.stat(path)[6]
+        except OSError:
+            size = self._adopt_scratch()
+        self._count = size // RECORD_SIZE
+        if size % RECORD_SIZE:
+            self._drop_torn_tail()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, block, flags=0):
+        """Append a 16-byte block and return its record number."""
+        if len(block) != BLOCK_SIZE:
+            raise ValueError("Records hold 16-byte blocks")
+        _pack(self._record, flags, block)
+        with open(self.path, "ab") as f:
+            f.write(self._record)
+        self._count += 1
+        return self._count - 1
+
+    def read(self, index):
+        """Return (flags, block) of record index, or None if it is damaged.
+        The block is a memoryview that the next read overwrites."""
+        if not 0 <= index < self._count:
+            raise IndexError("No record {}".format(index))
+        with open(self.path, "rb") as f:
+            f.seek(index * RECORD_SIZE)
+            f.readinto(self._record)
+        if not _intact(self._record):
+            return None
+        return self._record[1], memoryview(self._record)[2:_CRC_OFFSET]
+
+    def records(self):
+        """Yield (index, flags, block) for every undamaged record, oldest
+        first, reading the file once. The block is a memoryview that is
+        overwritten by the next record."""
+        record = bytearray(RECORD_SIZE)
+        with open(self.path, "rb") as f:
+            for index in range(self._count):
+                if f.readinto(record) != RECORD_SIZE:
+                    break
+                if _intact(record):
+                    yield index, record[1], memoryview(record)[2:_CRC_OFFSET]
+
+    def rewrite(self, records):
+        """Replace every record with the (flags, block) pairs from records,
+        which may read from this store. They are written to a scratch file
+        that is then renamed over the store, so a power loss leaves either
+        the old records or the new ones."""
+        scratch = self.path + _SCRATCH
+        count = 0
+        with open(scratch, "wb") as f:
+            for flags, block in records:
+                _pack(self._record, flags, block)
+                f.write(self._record)
+                count += 1
+        os.rename(scratch, self.path)
+        self._count = count
+
+    def clear(self):
+        """Remove every record."""
+        open(self.path, "wb").close()
+        self._count = 0
+
+    def migrate_json(self, json_path):
+        """Append the blocks of a list saved as JSON by older firmware (hex
+        strings or lists of byte values) and delete the JSON file, so this
+        only happens once. Entries that aren't 16-byte blocks are dropped,
+        and so is an empty file. A file that doesn't parse as a list, e.g.
+        one cut short by a power loss, is renamed to json_path + ".bad" with
+        a warning instead. Returns the number of blocks brought in; 0 if
+        there is no such file."""
+        try:
+            with open(json_path, "r") as f:
+                text = f.read()
+        except OSError:
+            return 0
+        try:
+            data = ujson.loads(text) if text.strip() else []
+        except ValueError:
+            data = None  # truncated or corrupt
+        if not isinstance(data, list):
+            os.rename(json_path, json_path + _UNREADABLE)
+            print("Could not read {}, kept it as {}".format(
+                json_path, json_path + _UNREADABLE))
+            return 0
+        count = 0
+        for entry in data:
+            block = _parse_block(entry)
+            if block is not None:
+                self.append(block, FLAG_MIGRATED)
+                count += 1
+        os.remove(json_path)
+        return count
+
+    def _adopt_scratch(self):
+        # No store file: take over the scratch file of a rewrite whose rename
+        # was cut short on a filesystem that removes the target first, or
+        # start an empty store. Returns the size of the file.
+        try:
+            os.rename(self.path + _SCRATCH, self.path)
+            return os.stat(self.path)[6]
+        except OSError:
+            open(self.path, "wb").close()
+            return 0
+
+    def _drop_torn_tail(self):
+        # An append was cut short; rewrite the intact records so later
+        # appends stay aligned.
+        self.rewrite((flags, bytes(block)) for _, flags, block in self.records())
@@ -0,0 +1,276 @@
+"""
+Saved cards keyed by UID, on top of a RecordStore.
+
+Each UID is kept once: saving a card that is already there appends its new
+block and points the UID at it, and deleting one appends a copy of its last
+block flagged FLAG_DELETED. Opening the library replays the records in order,
+so the file always says which block is current.
+
+The UIDs live in an open-addressing hash table held as two array('H'): the
+record number + 1 in each slot (0 empty, 0xFFFF a deleted entry that lookups
+step over) and the 16-bit hash of its UID. Finding a UID hashes it, walks
+the few slots after its home slot and reads only the record whose hash
+matches to compare the UID itself, so lookups take about the same time
+however many cards are saved. The table costs 4 bytes a slot and is kept at
+most 3/4 full, 16 KB for two thousand cards.
+
+Records left behind by updates and deletes are dropped by compact(), which
+runs by itself once they outnumber the saved cards.
+"""
+
+from array import array
+from micropython import const
+from record_store import FLAG_DELETED
+
+# What save() did
+SAVED_NEW = const(0)
+SAVED_UPDATED = const(1)
+SAVED_UNCHANGED = const(2)
+
+_EMPTY = const(0)
+_TOMBSTONE = const(0xFFFF)
+_MIN_SLOTS = const(64)
+# Record numbers are stored + 1 and must stay below _TOMBSTONE
+_MAX_RECORDS = const(0xFFFE)
+# Don't rewrite the file for fewer dead records than this
+_COMPACT_MIN_DEAD = const(32)
+
+
+def mifare_uid(block):
+    """UID of a MIFARE Classic block 0: 4 bytes when byte 4 is their BCC,
+    otherwise 7."""
+    if block[0] ^ block[1] ^ block[2] ^ block[3] == block[4]:
+        return bytes(block[0:4])
+    return bytes(block[0:7])
+
+
+def ntag_uid(block):
+    """7-byte UID of NTAG pages 0-3, skipping BCC0 in byte 3."""
+    return bytes(block[0:3]) + bytes(block[4:8])
+
+
+def _hash(uid):
+    # Kept to 16 x 10 bit products so it runs on small ints
+    h = 0x2C9F
+    for b in uid:
+        h *= 0x3A5
+        h = (h ^ (h >> 16) ^ b) & 0xFFFF
+    h *= 0x3A5
+    return (h ^ (h >> 16)) & 0xFFFF
+
+
+def _zeros(count):
+    return array('H', (0 for _ in range(count)))
+
+
+class UIDLibrary:
+    """The cards saved in store, keyed by uid_of(block)."""
+
+    def __init__(self, store, uid_of):
+        self.store = store
+        self._uid_of = uid_of
+        self._rebuild()
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, uid):
+        uid = bytes(uid)
+        return self._find(uid, _hash(uid))[0] >= 0
+
+    def find(self, uid):
+        """Return the saved block for uid as a memoryview that the next
+        lookup overwrites, or None if the UID isn't saved."""
+        uid = bytes(uid)
+        slot = self._find(uid, _hash(uid))[0]
+        if slot < 0:
+            return None
+        entry = self.store.read(self._slots[slot] - 1)
+        return None if entry is None else entry[1]
+
+    def save(self, block):
+        """Save a 16-byte block under its UID, replacing the one saved
+        before. Returns SAVED_NEW for a new UID, SAVED_UPDATED if the UID
+        was saved with another block, or SAVED_UNCHANGED if it was saved
+        with this one (the file isn't touched then)."""
+        uid = self._uid_of(block)
+        h = _hash(uid)
+        slot = self._find(uid, h)[0]
+        if slot >= 0:
+            entry = self.store.read(self._slots[slot] - 1)
+            if entry is not None and bytes(entry[1]) == bytes(block):
+                return SAVED_UNCHANGED
+        self._make_room()
+        record = self.store.append(block)
+        # _make_room may have compacted, so look the slot up again
+        if not self._put(uid, h, record):
+            self._dead += 1
+            self._maybe_compact()
+            return SAVED_UPDATED
+        return SAVED_NEW
+
+    def delete(self, uid):
+        """Forget uid. Returns False if it wasn't saved."""
+        uid = bytes(uid)
+        h = _hash(uid)
+        slot = self._find(uid, h)[0]
+        if slot >= 0:
+            block = bytes(self.store.read(self._slots[slot] - 1)[1])
+        elif self._damaged(h):
+            # The current record may be the damaged one. Replay skips it and
+            # would bring back the block saved before, so withdraw that.
+            block = self._last_intact(uid)
+            if block is None:
+                return False
+        else:
+            return False
+        self._make_room()
+        # _make_room may have compacted, so look the slot up again
+        slot = self._find(uid, h)[0]
+        self.store.append(block, FLAG_DELETED)
+        self._dead += 2
+        if slot >= 0:
+            self._slots[slot] = _TOMBSTONE
+            self._live -= 1
+        self._maybe_compact()
+        return True
+
+    def items(self):
+        """Yield the saved blocks, oldest first, as memoryviews that are
+        overwritten by the next one."""
+        for _, _, block in self._current():
+            yield block
+
+    def clear(self):
+        """Forget every card."""
+        self.store.clear()
+        self._rebuild()
+
+    def compact(self):
+        """Rewrite the file with only the current block of each card. The
+        store swaps the new file in whole (see RecordStore.rewrite), so a
+        power loss midway keeps the old one."""
+        self.store.rewrite((flags, block) for _, flags, block in self._current())
+        self._rebuild()
+
+    def _rebuild(self):
+        # Replay the file into a fresh table.
+        self._slots = _zeros(_MIN_SLOTS)
+        self._hashes = _zeros(_MIN_SLOTS)
+        self._used = 0  # slots holding an entry or a tombstone
+        self._live = 0
+        self._dead = 0
+        for index, flags, block in self.store.records():
+            uid = self._uid_of(block)
+            h = _hash(uid)
+            if flags & FLAG_DELETED:
+                slot = self._find(uid, h)[0]
+                if slot >= 0:
+                    self._slots[slot] = _TOMBSTONE
+                    self._live -= 1
+                    self._dead += 1
+                self._dead += 1
+            elif not self._put(uid, h, index):
+                self._dead += 1
+
+    def _find(self, uid, h):
+        # Return (slot holding uid or -1, first slot a new entry could use).
+        slots = self._slots
+        mask = len(slots) - 1
+        i = h & mask
+        free = -1
+        while True:
+            value = slots[i]
+            if value == _EMPTY:
+                return -1, (i if free < 0 else free)
+            if value == _TOMBSTONE:
+                if free < 0:
+                    free = i
+            elif self._hashes[i] == h:
+                entry = self.store.read(value - 1)
+                if entry is not None and self._uid_of(entry[1]) == uid:
+                    return i, free
+            i = (i + 1) & mask
+
+    def _put(self, uid, h, record):
+        # Point uid at record; True if it wasn't in the table.
+        slot, free = self._find(uid, h)
+        if slot >= 0:
+            self._slots[slot] = record + 1
+            return False
+        if self._slots[free] == _EMPTY:
+            self._used += 1
+        self._slots[free] = record + 1
+        self._hashes[free] = h
+        self._live += 1
+        if self._used * 4 > len(self._slots) * 3:
+            self._rehash()
+        return True
+
+    def _rehash(self):
+        # Drop the tombstones, doubling the table unless they were most of
+        # what filled it. Entries are placed by their stored hash, so no
+        # record is read.
+        size = len(self._slots)
+        if self._live * 2 >= size:
+            size *= 2
+        mask = size - 1
+        slots = _zeros(size)
+        hashes = _zeros(size)
+        for i, value in enumerate(self._slots):
+            if value == _EMPTY or value == _TOMBSTONE:
+                continue
+            h = self._hashes[i]
+            j = h & mask
+            while slots[j] != _EMPTY:
+                j = (j + 1) & mask
+            slots[j] = value
+            hashes[j] = h
+        self._slots = slots
+        self._hashes = hashes
+        self._used = self._live
+
+    def _current(self):
+        # (index, flags, block) of the records the table points at.
+        slots = self._slots
+        mask = len(slots) - 1
+        for index, flags, block in self.store.records():
+            if flags & FLAG_DELETED:
+                continue
+            i = _hash(self._uid_of(block)) & mask
+            while slots[i] != _EMPTY:
+                if slots[i] == index + 1:
+                    yield index, flags, block
+                    break
+                i = (i + 1) & mask
+
+    def _damaged(self, h):
+        # True if a slot for hash h points at a record that fails its CRC.
+        slots = self._slots
+        mask = len(slots) - 1
+        i = h & mask
+        while slots[i] != _EMPTY:
+            if slots[i] != _TOMBSTONE and self._hashes[i] == h and \
+                    self.store.read(slots[i] - 1) is None:
+                return True
+            i = (i + 1) & mask
+        return False
+
+    def _last_intact(self, uid):
+        # Newest block of uid that replay would bring back, found by walking
+        # the file; None if it was withdrawn or there is none.
+        found = None
+        for _, flags, block in self.store.records():
+            if self._uid_of(block) == uid:
+                found = None if flags & FLAG_DELETED else bytes(block)
+        return found
+
+    def _make_room(self):
+        if len(self.store) >= _MAX_RECORDS:
+            self.compact()
+            if len(self.store) >= _MAX_RECORDS:
+                raise RuntimeError('UID library is full!')
+
+    def _maybe_compact(self):
+        if self._dead > _COMPACT_MIN_DEAD and self._dead > self._live:
+            self.compact()
@@ -17,7 +17,13 @@ https://github.com/Carglglz/NFC_PN532_SPI
 """
 
 import time
-from machine import Pin
+import micropython
+from array import array
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+from machine import Pin, idle
 from micropython import const
 
 # __version__ = "0.0.0-auto.0"
@@ -39,11 +45,17 @@ _COMMAND_GETGENERALSTATUS = const(0x04)
 _COMMAND_SETSERIALBAUDRATE = const(0x10)
 _COMMAND_SETPARAMETERS = const(0x12)
 _COMMAND_SAMCONFIGURATION = const(0x14)
+_COMMAND_READREGISTER = const(0x06)
+_COMMAND_WRITEREGISTER = const(0x08)
+_COMMAND_POWERDOWN = const(0x16)
+_COMMAND_RFCONFIGURATION = const(0x32)
 
 _COMMAND_INLISTPASSIVETARGET = const(0x4A)
 
 _COMMAND_INDATAEXCHANGE = const(0x40)
 _COMMAND_INCOMMUNICATETHRU = const(0x42)
+_COMMAND_INRELEASE = const(0x52)
+_COMMAND_INPSL = const(0x4E)
 
 
 _RESPONSE_INDATAEXCHANGE = const(0x41)
@@ -51,7 +63,39 @@ _RESPONSE_INLISTPASSIVETARGET = const(0x4B)
 
 _WAKEUP = const(0x55)
 
+# PowerDown wake-up sources (WakeUpEnable bits)
+POWERDOWN_WAKE_INT0 = const(0x01)
+POWERDOWN_WAKE_INT1 = const(0x02)
+POWERDOWN_WAKE_RF = const(0x08)
+POWERDOWN_WAKE_HSU = const(0x10)
+POWERDOWN_WAKE_SPI = const(0x20)
+POWERDOWN_WAKE_GPIO = const(0x40)
+POWERDOWN_WAKE_I2C = const(0x80)
+
 _MIFARE_ISO14443A = const(0x00)
+# card_baud values for FeliCa cards
+FELICA_212 = const(0x01)
+FELICA_424 = const(0x02)
+# FeliCa POLLING for InListPassiveTarget: any system code, ask for the
+# card's system code, one time slot
+_FELICA_POLLING = (0x00, 0xFF, 0xFF, 0x01, 0x00)
+
+# RF bit rates for set_bitrate (InPSL BRit/BRti), and their speed in kbps
+BITRATE_106 = const(0x00)
+BITRATE_212 = const(0x01)
+BITRATE_424 = const(0x02)
+BITRATE_848 = const(0x03)
+BITRATE_KBPS = (106, 212, 424, 848)
+
+# RFConfiguration items
+_RFCONFIG_FIELD = const(0x01)
+_RFCONFIG_MAX_RETRIES = const(0x05)
+
+# CIU registers (high byte, low byte) used for raw ISO14443A frames
+_REG_TX_MODE = const(0x6302)
+_REG_RX_MODE = const(0x6303)
+_REG_BIT_FRAMING = const(0x633D)
+_CRC_ENABLE = const(0x80)  # TxMode/RxMode bit 7: PN532 adds/checks CRC_A
 
 # Mifare Commands
 MIFARE_CMD_AUTH_A = const(0x60)
@@ -59,12 +103,58 @@ MIFARE_CMD_AUTH_B = const(0x61)
 MIFARE_CMD_READ = const(0x30)
 MIFARE_CMD_WRITE = const(0xA0)
 MIFARE_ULTRALIGHT_CMD_WRITE = const(0xA2)
+MIFARE_ACK = const(0x0A)  # 4-bit ACK answer
+ISO14443A_CMD_HALT = const(0x50)
+# Gen1a "Chinese magic" backdoor: 0x40 sent as 7 bits, then 0x43, after
+# which blocks can be written without authentication.
+GEN1A_CMD_UNLOCK1 = const(0x40)
+GEN1A_CMD_UNLOCK2 = const(0x43)
+
+# Block 0 write strategies, see mifare_classic_clone_block0
+CLONE_GEN1A = const(1)
+CLONE_DIRECT = const(2)
+
+# Card families reported by classify(), and their names
+CARD_UNKNOWN = const(0)
+CARD_MIFARE_MINI = const(1)
+CARD_MIFARE_CLASSIC_1K = const(2)
+CARD_MIFARE_CLASSIC_4K = const(3)
+CARD_MIFARE_ULTRALIGHT = const(4)  # Ultralight and NTAG2xx
+CARD_MIFARE_PLUS = const(5)
+CARD_MIFARE_DESFIRE = const(6)
+CARD_ISO14443_4 = const(7)  # other ISO14443-4 cards: bank cards, phones
+CARD_NAMES = ('Unknown', 'MIFARE Mini', 'MIFARE Classic 1K', 'MIFARE Classic 4K',
+              'Ultralight/NTAG', 'MIFARE Plus', 'DESFire', 'ISO14443-4')
+
+# Card capabilities reported by classify()
+CAP_CLASSIC = const(0x01)  # Crypto1 sectors: authenticate, then 16-byte blocks
+CAP_PAGES = const(0x02)  # 4-byte pages read and written without authenticating
+CAP_ISO_DEP = const(0x04)  # ISO14443-4 APDUs
+
+# NTAG21x Commands
+NTAG_CMD_GET_VERSION = const(0x60)
+NTAG_CMD_FAST_READ = const(0x3A)
+
+# NTAG213/215/216 total page count, by the storage size byte of GET_VERSION
+_NTAG_PAGES = {0x0F: 45, 0x11: 135, 0x13: 231}
+# Pages per FAST_READ: 60 pages (240 bytes) keeps the response in one frame
+_FAST_READ_PAGES = const(60)
+# Pages of a MIFARE Ultralight, read when the tag doesn't answer GET_VERSION
+_ULTRALIGHT_PAGES = const(16)
+
+# NFC Forum Type 4 tags: NDEF application name, capability container file,
+# its length, and the status word of a successful APDU.
+_NDEF_APP = b'\xD2\x76\x00\x00\x85\x01\x01'
+_CC_FILE = b'\xE1\x03'
+_CC_LEN = const(15)
+_SW_OK = const(0x9000)
 
 # Known keys
 KEY_DEFAULT_B = bytes([0xFF]*6)
 
 
 _ACK = b'\x00\x00\xFF\x00\xFF\x00'
+_NACK = b'\x00\x00\xFF\xFF\x00\x00'
 _FRAME_START = b'\x00\x00\xFF'
 # pylint: enable=bad-whitespace
 _SPI_STATREAD = const(0x02)
@@ -72,16 +162,225 @@ _SPI_DATAWRITE = const(0x01)
 _SPI_DATAREAD = const(0x03)
 _SPI_READY = const(0x01)
 
+# SPI bus timing in microseconds. The PN532 datasheet only asks for NSS to be
+# asserted a few tens of ns before the first clock edge and to stay high
+# between frames for about one clock period, so 1 us (the finest sleep_us
+# step) covers both. The ready poll interval bounds how long a finished
+# command can sit unnoticed while _wait_ready polls the status byte.
+_CS_SETUP_US = const(1)
+_CS_HOLD_US = const(1)
+_READY_POLL_US = const(1000)
+# With an IRQ pin the status byte is still read this often (ms) as a backstop,
+# which also detects boards where the IRQ line is not actually connected.
+_IRQ_BACKSTOP_MS = const(50)
+
+# Size of the preallocated SPI buffers: the largest PN532 frame (an extended
+# information frame with 264 data bytes) plus its framing bytes.
+_SPI_BUF_LEN = const(280)
+# Offset of the frame data (TFI onwards) in the transmit buffer, after the
+# SPI data write byte, preamble, start code and the extended frame's
+# 0xFF 0xFF LENm LENl LCS; a normal frame starts 3 bytes later.
+_TX_DATA = const(9)
+# Response frame header read before its length is known: preamble, start
+# code, LEN and LCS.
+_FRAME_HEAD = const(5)
+# Longest frame data (TFI onwards) the PN532 takes, and the most data bytes
+# one InDataExchange carries each way.
+_MAX_FRAME_DATA = const(265)
+_MAX_EXCHANGE_DATA = const(262)
+# InDataExchange Tg and status bit saying more data follows (chaining)
+_MORE_INFORMATION = const(0x40)
+
+# Time (ms) the PN532 needs after the SPI wake-up byte before it takes a
+# command again, once it has been powered down.
+_POWER_DOWN_WAKE_MS = const(2)
+
+# Error recovery tiers, tried in this order, and their timings. The ACK to a
+# command comes within _ACK_TIMEOUT ms; a resync waits _RESYNC_US after the
+# aborting ACK, a hardware reset holds RST low and then waits for the
+# oscillator for the given ms, and a re-init gets _REINIT_TIMEOUT ms.
+_RECOVERY_RESYNC = const(0)
+_RECOVERY_REINIT = const(1)
+_RECOVERY_RESET = const(2)
+_RECOVERY_TIERS = const(3)
+_ACK_TIMEOUT = const(10)
+_RESYNC_US = const(500)
+_RESET_LOW_MS = const(1)
+_RESET_SETTLE_MS = const(10)
+_REINIT_TIMEOUT = const(100)
+# SAMConfiguration: normal mode, 1 s virtual card timeout, use the IRQ pin
+_SAM_PARAMS = (0x01, 0x14, 0x01)
+
+# Boot: how long begin() keeps polling for the PN532 and the timeout of each
+# GetFirmwareVersion probe (ms).
+_BOOT_TIMEOUT = const(1000)
+_BOOT_POLL_MS = const(20)
 
-def _reset(pin):
-    """Perform a hardware reset toggle"""
+# InListPassiveTarget finds at most two ISO14443A cards at once; SAK bit 5
+# marks a card that supports ISO14443-4.
+_MAX_TARGETS = const(2)
+_SAK_ISO14443_4 = const(0x20)
+
+# Timeout (ms) for selecting a card again that should still be in the field.
+_RESELECT_TIMEOUT = const(100)
+# Time (ms) the RF field is kept off to reset every card in the field, and
+# the timeout for raw frames a card answers straight away.
+_FIELD_RESET_MS = const(10)
+_THRU_TIMEOUT = const(100)
+
+# Command statistics: distinct command codes tracked, the phases each command
+# is timed in (write, ACK wait, response wait, read) and the number of
+# latency histogram buckets. Bucket 0 holds times under 16 us, bucket k times
+# under 16 << k us, and the last bucket everything slower (over 0.26 s).
+_STATS_SLOTS = const(16)
+_STATS_PHASES = const(4)
+_STATS_BUCKETS = const(16)
+_STATS_UNUSED = const(0xFF)
+# Phase totals are kept as whole ms plus the us left over, so they stay small
+# ints. A total reaching this many ms (about six days) is halved together with
+# its sample count, once that is even, which keeps the average right.
+_STATS_TOTAL_MAX_MS = const(0x20000000)
+# Per-command counters, in this order
+_STAT_CALLS = const(0)
+_STAT_ERRORS = const(1)
+_STAT_TIMEOUTS = const(2)
+_STATS_PHASE_NAMES = ('write', 'ack', 'response', 'read')
+
+
+def _reset(pin, low_ms, settle_ms):
+    """Perform a hardware reset toggle: hold RST low for low_ms, then give
+    the PN532 settle_ms to start up."""
     pin.init(Pin.OUT)
-    pin.value(True)
-    time.sleep(0.1)
     pin.value(False)
-    time.sleep(0.5)
+    time.sleep_ms(low_ms)
     pin.value(True)
-    time.sleep(0.1)
+    time.sleep_ms(settle_ms)
+
+
+def _mifare_sector(block_number):
+    """Return the sector holding a MiFare classic block (1K and 4K layouts)."""
+    if block_number < 128:
+        return block_number // 4
+    return 32 + (block_number - 128) // 16
+
+
+def _crc_a(buf, count):
+    """Append the ISO14443A CRC of the first count bytes of buf at
+    buf[count] and buf[count+1]."""
+    crc = 0x6363
+    for i in range(count):
+        byte = (buf[i] ^ crc) & 0xFF
+        byte = (byte ^ (byte << 4)) & 0xFF
+        crc = (crc >> 8) ^ (byte << 8) ^ (byte << 3) ^ (byte >> 4)
+    buf[count] = crc & 0xFF
+    buf[count + 1] = (crc >> 8) & 0xFF
+
+
+def _poll_params(card_baud):
+    """InListPassiveTarget parameters asking for one card at card_baud."""
+    if card_baud in (FELICA_212, FELICA_424):
+        return (0x01, card_baud) + _FELICA_POLLING
+    return (0x01, card_baud)
+
+
+def _passive_target_uid(response, card_baud=_MIFARE_ISO14443A):
+    """Return the UID (the IDm of a FeliCa card) from an InListPassiveTarget
+    response for one card, or None if no response is available."""
+    # If no response is available return None to indicate no card is present.
+    if response is None or response[0] == 0x00:
+        return None
+    # Check only 1 card with up to a 10 byte UID is present.
+    if response[0] != 0x01:
+        raise RuntimeError('More than one card detected!')
+    if card_baud in (FELICA_212, FELICA_424):
+        # Tg, POL_RES length, response code 0x01, IDm, PMm, system code
+        return bytearray(response[4:12])
+    if response[5] > 10:
+        raise RuntimeError('Found card with unexpectedly long UID!')
+    # Return UID of card.
+    return bytearray(response[6:6+response[5]])
+
+
+def _parse_targets(response):
+    """Return a list with a Target for every card in an ISO14443A
+    InListPassiveTarget response (empty if there is none)."""
+    targets = []
+    if response is None:
+        return targets
+    pos = 1
+    for _ in range(response[0]):
+        uid_end = pos + 5 + response[pos + 4]
+        target = Target(response[pos], (response[pos + 1] << 8) | response[pos + 2],
+                        response[pos + 3], bytearray(response[pos + 5:uid_end]))
+        pos = uid_end
+        # Cards that support ISO14443-4 are followed by their ATS, whose
+        # first byte is its length including itself.
+        if target.sak & _SAK_ISO14443_4 and pos < len(response):
+            target.ats = bytes(response[pos + 1:pos + response[pos]])
+            pos += response[pos]
+        targets.append(target)
+    return targets
+
+
+# Card family and capabilities by SAK (NXP AN10833), filled in once at import
+_SAK_FAMILY = bytearray(256)
+_SAK_CAPS = bytearray(256)
+for _sak, _family, _caps in (
+        (0x09, CARD_MIFARE_MINI, CAP_CLASSIC),
+        (0x08, CARD_MIFARE_CLASSIC_1K, CAP_CLASSIC),
+        (0x88, CARD_MIFARE_CLASSIC_1K, CAP_CLASSIC),  # Infineon
+        (0x18, CARD_MIFARE_CLASSIC_4K, CAP_CLASSIC),
+        # SmartMX chips that emulate a Classic next to ISO14443-4
+        (0x28, CARD_MIFARE_CLASSIC_1K, CAP_CLASSIC | CAP_ISO_DEP),
+        (0x38, CARD_MIFARE_CLASSIC_4K, CAP_CLASSIC | CAP_ISO_DEP),
+        (0x00, CARD_MIFARE_ULTRALIGHT, CAP_PAGES),
+        (0x10, CARD_MIFARE_PLUS, 0),  # security level 2
+        (0x11, CARD_MIFARE_PLUS, 0),
+        (0x20, CARD_ISO14443_4, CAP_ISO_DEP)):
+    _SAK_FAMILY[_sak] = _family
+    _SAK_CAPS[_sak] = _caps
+del _sak, _family, _caps
+
+
+def max_bitrate(ats):
+    """Return the highest BITRATE_ an ISO14443-4 card takes both ways, from
+    the TA(1) byte of its ATS (without the length byte, as in Target.ats),
+    or BITRATE_106 if the ATS doesn't list any."""
+    if not ats or not ats[0] & 0x10:
+        return BITRATE_106
+    # TA(1) bits 7-5 are the card to reader divisors 8, 4, 2; bits 3-1 the
+    # reader to card ones.
+    both = (ats[1] >> 4) & ats[1] & 0x07
+    rate = BITRATE_106
+    for bit in range(3):
+        if both & (1 << bit):
+            rate = bit + 1
+    return rate
+
+
+def classify(atqa, sak, uid_length=4):
+    """Return the family (a CARD_ constant) and capabilities (CAP_ flags) of
+    an ISO14443A card from its ATQA, SAK and UID length. Only anticollision
+    data is used, so a card faking another's SAK is taken for what it claims
+    to be."""
+    family = _SAK_FAMILY[sak]
+    caps = _SAK_CAPS[sak]
+    if family == CARD_MIFARE_ULTRALIGHT and uid_length != 7:
+        # Ultralight and NTAG always have 7-byte UIDs.
+        return CARD_UNKNOWN, 0
+    if family == CARD_ISO14443_4 and atqa == 0x0344:
+        return CARD_MIFARE_DESFIRE, caps
+    if family == CARD_UNKNOWN and sak & _SAK_ISO14443_4:
+        return CARD_ISO14443_4, CAP_ISO_DEP
+    return family, caps
+
+
+def _status_counter(command, response):
+    """Return _STAT_ERRORS if response carries a card error status."""
+    if command in (_COMMAND_INDATAEXCHANGE, _COMMAND_INCOMMUNICATETHRU):
+        if len(response) and response[0] & 0x3F:
+            return _STAT_ERRORS
+    return None
 
 
 class BusyError(Exception):
@@ -100,209 +399,728 @@ def reverse_bit(num):
     return result
 
 
+# Bit-reversed value of every byte, so frames can be converted with one table
+# lookup per byte instead of an 8-step loop.
+_REVERSE_TABLE = bytes(reverse_bit(i) for i in range(256))
+
+_STATREAD_LSB = bytes([reverse_bit(_SPI_STATREAD)])
+_DATAREAD_LSB = bytes([reverse_bit(_SPI_DATAREAD)])
+_READY_LSB = const(0x80)  # reverse_bit(_SPI_READY)
+
+
+def _reverse_bytes(buf, count):
+    """Reverse the bit order of the first count bytes of buf in place."""
+    table = _REVERSE_TABLE
+    for i in range(count):
+        buf[i] = table[buf[i]]
+
+
+try:
+    @micropython.viper
+    def _reverse_bytes(buf, count: int):  # pylint: disable=function-redefined
+        """Native-code version of _reverse_bytes for ports with viper."""
+        table = ptr8(_REVERSE_TABLE)  # pylint: disable=undefined-variable
+        data = ptr8(buf)  # pylint: disable=undefined-variable
+        for i in range(count):
+            data[i] = table[data[i]]
+except AttributeError:
+    pass  # no viper emitter, keep the table-driven Python version
+
+
+def _zeros(typecode, count):
+    return array(typecode, [0] * count)
+
+
+class Target:
+    """A card found by PN532.list_targets: tg is the target number the PN532
+    gave it, atqa (as an int) and sak come from its anticollision, uid is a
+    bytearray and ats the ISO14443-4 answer to select, or None."""
+    __slots__ = ('tg', 'atqa', 'sak', 'uid', 'ats')
+
+    def __init__(self, tg, atqa, sak, uid, ats=None):
+        self.tg = tg
+        self.atqa = atqa
+        self.sak = sak
+        self.uid = uid
+        self.ats = ats
+
+    def classify(self):
+        """Return the family and capabilities of the card, see classify()."""
+        return classify(self.atqa, self.sak, len(self.uid))
+
+    def max_bitrate(self):
+        """Return the highest BITRATE_ the card takes, see max_bitrate()."""
+        return max_bitrate(self.ats)
+
+    def __repr__(self):
+        return 'Target({}, 0x{:04X}, 0x{:02X}, {})'.format(
+            self.tg, self.atqa, self.sak,
+            ''.join('{:02X}'.format(b) for b in self.uid))
+
+
+class _CommandStats:
+    """Per-command call counters and phase latencies kept in fixed-size
+    arrays, so recording a call never allocates. Each call is timed with
+    start(), one mark() at the end of every phase it got through and a
+    finish() with the counter to bump, if any, besides the call count."""
+
+    def __init__(self):
+        self._slot_of = bytearray([_STATS_UNUSED] * 256)
+        self._codes = bytearray(_STATS_SLOTS)
+        self._used = 0
+        self._counts = _zeros('L', _STATS_SLOTS * 3)
+        phases = _STATS_SLOTS * _STATS_PHASES
+        self._samples = _zeros('L', phases)
+        self._min = _zeros('L', phases)
+        self._max = _zeros('L', phases)
+        self._total_ms = _zeros('L', phases)
+        self._total_us = _zeros('H', phases)
+        self._total_n = _zeros('L', phases)
+        self._hist = _zeros('L', phases * _STATS_BUCKETS)
+        self._slot = _STATS_UNUSED
+        self._phase = 0
+        self._stamp = 0
+
+    def reset(self):
+        self.__init__()
+
+    def start(self, command):
+        slot = self._slot_of[command & 0xFF]
+        if slot == _STATS_UNUSED and self._used < _STATS_SLOTS:
+            slot = self._used
+            self._used += 1
+            self._codes[slot] = command & 0xFF
+            self._slot_of[command & 0xFF] = slot
+        self._slot = slot
+        self._phase = 0
+        self._stamp = time.ticks_us()
+
+    def mark(self):
+        """End the current phase of the call being timed."""
+        now = time.ticks_us()
+        us = time.ticks_diff(now, self._stamp)
+        self._stamp = now
+        if self._slot == _STATS_UNUSED or self._phase >= _STATS_PHASES:
+            return
+        i = self._slot * _STATS_PHASES + self._phase
+        self._phase += 1
+        if self._samples[i] == 0 or us < self._min[i]:
+            self._min[i] = us
+        if us > self._max[i]:
+            self._max[i] = us
+        self._samples[i] += 1
+        self._total_n[i] += 1
+        total = self._total_us[i] + us
+        if total >= 1000:
+            self._total_ms[i] += total // 1000
+            total %= 1000
+        if self._total_ms[i] >= _STATS_TOTAL_MAX_MS and \
+                not self._total_n[i] & 1:
+            total = (total + (self._total_ms[i] & 1) * 1000) >> 1
+            self._total_ms[i] >>= 1
+            self._total_n[i] >>= 1
+        self._total_us[i] = total
+        bucket = 0
+        us >>= 4
+        while us and bucket < _STATS_BUCKETS - 1:
+            us >>= 1
+            bucket += 1
+        self._hist[i * _STATS_BUCKETS + bucket] += 1
+
+    def finish(self, counter=None):
+        """Count the call being timed, and also under counter if given."""
+        if self._slot == _STATS_UNUSED:
+            return
+        base = self._slot * 3
+        self._counts[base + _STAT_CALLS] += 1
+        if counter is not None:
+            self._counts[base + counter] += 1
+
+    def _p95(self, i):
+        """Upper bound of the histogram bucket holding the 95th percentile."""
+        wanted = (self._samples[i] * 95 + 99) // 100
+        seen = 0
+        for bucket in range(_STATS_BUCKETS - 1):
+            seen += self._hist[i * _STATS_BUCKETS + bucket]
+            if seen >= wanted:
+                return min(16 << bucket, self._max[i])
+        return self._max[i]
+
+    def _average(self, i):
+        """Average of phase i in us."""
+        return ((self._total_ms[i] * 1000 + self._total_us[i]) //
+                self._total_n[i])
+
+    def get(self, command):
+        """See PN532.command_stats."""
+        slot = self._slot_of[command & 0xFF]
+        if slot == _STATS_UNUSED:
+            return None
+        phases = []
+        for i in range(slot * _STATS_PHASES, (slot + 1) * _STATS_PHASES):
+            n = self._samples[i]
+            if n:
+                phases.append((self._min[i], self._average(i),
+                               self._p95(i), self._max[i]))
+            else:
+                phases.append(None)
+        base = slot * 3
+        return (self._counts[base + _STAT_CALLS],
+                self._counts[base + _STAT_ERRORS],
+                self._counts[base + _STAT_TIMEOUTS], tuple(phases))
+
+    def commands(self):
+        return bytes(self._codes[:self._used])
+
+
 class PN532:
     """Driver for the PN532 connected over SPI. Pass in a hardware or bitbang
-    SPI device & chip select digitalInOut pin. Optional IRQ pin (not used),
-    reset pin and debugging output."""
+    SPI device & chip select digitalInOut pin. Optional IRQ pin (used to wait
+    for responses without polling the bus), reset pin and debugging output."""
 
-    def __init__(self, spi, cs_pin, irq=None, reset=None, debug=False):
-        """Create an instance of the PN532 class using SPI"""
+    def __init__(self, spi, cs_pin, irq=None, reset=None, debug=False,
+                 cs_setup_us=_CS_SETUP_US, cs_hold_us=_CS_HOLD_US,
+                 ready_poll_us=_READY_POLL_US, init=True):
+        """Create an instance of the PN532 class using SPI. cs_setup_us is the
+        delay between asserting chip select and the first clock, cs_hold_us
+        the minimum time chip select stays high after a transaction and
+        ready_poll_us the interval between status polls. With init=False the
+        PN532 is not touched until begin() is called, so that can be done
+        later or on another core."""
         self.debug = debug
         self._irq = irq
         self.CSB = cs_pin
         self._spi = spi
+        self._cs_setup_us = cs_setup_us
+        self._cs_hold_us = cs_hold_us
+        self._ready_poll_us = ready_poll_us
+        self._transactions = 0
+        self._transaction_us = 0
+        self._status = bytearray(1)
+        self._tx = bytearray(_SPI_BUF_LEN)
+        self._rx = bytearray(_SPI_BUF_LEN)
+        self._tx_mv = memoryview(self._tx)
+        self._rx_mv = memoryview(self._rx)
+        # Fixed views for the ACK and the frame header, so reading them
+        # doesn't make a new memoryview every command.
+        self._ack_mv = self._rx_mv[:len(_ACK)]
+        self._head_mv = self._rx_mv[:_FRAME_HEAD]
+        self._irq_flag = False
+        self._passive_retries = None  # MxRtyPassiveActivation, once known
+        # MiFare classic session as (uid, sector, key_number, key), while the
+        # card is still authenticated for that sector.
+        self._auth = None
+        self._held_auth = None
+        self._stats = _CommandStats()
+        # Target number InDataExchange talks to, the cards list_targets found
+        # last, UIDs of the cards select_target passed over, ATQA and SAK of
+        # the selected card as one int, and the block 0 write strategy that
+        # last worked for each ATQA and SAK.
+        self._tg = 0x01
+        self._targets = []
+        self._bystanders = []
+        self._card_type = None
+        self._uid_length = 0
+        self._clone_strategies = {}
+        # Power down state: set while the PN532 sleeps, with counters for
+        # power_stats.
+        self._powered_down = False
+        self._power_downs = 0
+        self._down_since = 0
+        self._down_ms = 0
+        # Error recovery: RST pin for the last tier, runs of each tier, and
+        # whether a failed call had got as far as reading its response.
+        self._reset_pin = reset
+        self._recoveries = _zeros('L', _RECOVERY_TIERS)
+        self._response_pending = False
+        self.last_error = None
+        self.firmware_version = None
+        self.boot_ms = None
+        if irq is not None:
+            irq.irq(trigger=Pin.IRQ_FALLING, handler=self._irq_handler)
         self.CSB.on()
-        if reset:
-            if debug:
+        if init:
+            self.begin()
+
+    def begin(self, timeout=_BOOT_TIMEOUT):
+        """Bring the PN532 up: reset it if there is an RST pin, then wake it
+        and poll it with GetFirmwareVersion until it answers, for at most
+        timeout milliseconds. Returns the firmware version tuple, which is
+        also kept in firmware_version, and sets boot_ms to the time it took.
+        Raises RuntimeError if the PN532 never answers."""
+        start = time.ticks_ms()
+        if self._reset_pin is not None:
+            if self.debug:
                 print("Resetting")
-            _reset(reset)
+            _reset(self._reset_pin, _RESET_LOW_MS, 0)
+        while True:
+            # Only the SPI wake-up byte is needed, the PN532 is polled
+            # instead of waited for.
+            self._wake()
+            try:
+                response = self._call(_COMMAND_GETFIRMWAREVERSION, (), _BOOT_POLL_MS)
+            except (OSError, RuntimeError):
+                response = None
+            if response is not None:
+                break
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout:
+                raise RuntimeError('Failed to detect the PN532')
+        self.firmware_version = tuple(response)
+        self.boot_ms = time.ticks_diff(time.ticks_ms(), start)
+        return self.firmware_version
 
+    def _transfer(self, out, into=None):
+        """Run one SPI transaction framed by chip select: clock out `out` and,
+        if `into` is given, then clock in enough bytes to fill it. The elapsed
+        time is added to the transport statistics."""
+        start = self._select()
         try:
-            self._wakeup()
-            self.get_firmware_version()  # first time often fails, try 2ce
-            return
-        except (BusyError, RuntimeError):
-            pass
-        self.get_firmware_version()
+            self._spi.write(out)
+            if into is not None:
+                self._spi.readinto(into)
+        finally:
+            self._deselect(start)
 
-    def _wakeup(self):
-        """Send any special commands/data to wake up PN532"""
-        time.sleep(1)
+    def _select(self):
+        """Assert chip select and wait the setup time. Returns the start time
+        to hand to _deselect."""
+        start = time.ticks_us()
         self.CSB.off()
-        time.sleep_ms(2)
-        self._spi.write(bytearray([0x00]))
-        time.sleep_ms(2)
-        self.CSB.on()  # pylint: disable=no-member
-        time.sleep(1)
+        if self._cs_setup_us:
+            time.sleep_us(self._cs_setup_us)
+        return start
+
+    def _deselect(self, start):
+        """Release chip select, wait the hold time and account the
+        transaction started at `start` in the transport statistics."""
+        self.CSB.on()
+        if self._cs_hold_us:
+            time.sleep_us(self._cs_hold_us)
+        self._transactions += 1
+        self._transaction_us += time.ticks_diff(time.ticks_us(), start)
+
+    def transport_stats(self, reset=False):
+        """Return a tuple of the number of SPI transactions made, the total
+        microseconds spent in them and the average microseconds per
+        transaction. Pass reset=True to start counting afresh."""
+        count = self._transactions
+        total = self._transaction_us
+        if reset:
+            self._transactions = 0
+            self._transaction_us = 0
+        return count, total, total // count if count else 0
+
+    def command_stats(self, command):
+        """Return a tuple of the calls, errors and timeouts seen for command
+        and its phase latencies, or None if it was never called. Phase
+        latencies are (min, avg, p95, max) microseconds for the write, ACK
+        wait, response wait and read phases, None for a phase no call got
+        to. The p95 figure is the upper bound of its histogram bucket."""
+        return self._stats.get(command)
+
+    def dump_stats(self, reset=False):
+        """Print the statistics of every command called so far to the
+        console. Pass reset=True to start counting afresh."""
+        stats = self._stats
+        print('cmd    calls  errors  timeouts   (phase min/avg/p95/max us)')
+        for command in stats.commands():
+            calls, errors, timeouts, phases = stats.get(command)
+            print('0x{:02X} {:7d} {:7d} {:9d}'.format(command, calls, errors, timeouts))
+            for name, phase in zip(_STATS_PHASE_NAMES, phases):
+                if phase is not None:
+                    print('     {:<9} {}/{}/{}/{}'.format(name, *phase))
+        if reset:
+            stats.reset()
+
+    def _irq_handler(self, pin):  # pylint: disable=unused-argument
+        """IRQ falling edge: the PN532 has a frame ready for us."""
+        self._irq_flag = True
+
+    def _status_ready(self):
+        """Read the SPI status byte once, return True if a frame is ready."""
+        self._transfer(_STATREAD_LSB, self._status)
+        return self._status[0] == _READY_LSB  # LSB data is read in MSB
+
+    def _ready(self, poll_status):
+        """Check once whether the PN532 has a frame ready. With an IRQ pin
+        this looks at the IRQ edge flag and only reads the status byte when
+        poll_status is True, as a backstop that also detects an IRQ line that
+        isn't wired up. Without an IRQ pin the status byte is always read."""
+        if self._irq is None:
+            return self._status_ready()
+        if self._irq_flag:
+            return True
+        if poll_status and self._status_ready():
+            if self._irq.value():
+                # Ready but IRQ still high: it isn't wired up.
+                if self.debug:
+                    print("DEBUG: IRQ not asserted, polling instead")
+                self._irq.irq(handler=None)
+                self._irq = None
+            return True
+        return False
 
     def _wait_ready(self, timeout=1000):
-        """Poll PN532 if status byte is ready, up to `timeout` milliseconds"""
-        status_query = bytearray([reverse_bit(_SPI_STATREAD), 0])
-        status = bytearray([0, 0])
+        """Wait up to `timeout` milliseconds for the PN532 to be ready. With an
+        IRQ pin this sleeps until the IRQ edge, otherwise it polls the status
+        byte."""
         timestamp = time.ticks_ms()
+        backstop = timestamp
         while time.ticks_diff(time.ticks_ms(), timestamp) < timeout:
-            time.sleep(0.02)   # required
-            self.CSB.off()
-            time.sleep_ms(2)
-            self._spi.write_readinto(status_query, status)
-            time.sleep_ms(2)
-            self.CSB.on()
-            if reverse_bit(status[1]) == 0x01:  # LSB data is read in MSB
+            poll = time.ticks_diff(time.ticks_ms(), backstop) >= _IRQ_BACKSTOP_MS
+            if poll:
+                backstop = time.ticks_ms()
+            if self._ready(poll):
                 return True      # Not busy anymore!
+            if self._irq is None:
+                time.sleep_us(self._ready_poll_us)  # pause a bit till we ask again
             else:
-                time.sleep(0.01)  # pause a bit till we ask again
+                idle()  # sleep until the next interrupt or tick
         # Timed out!
-        return False
+        return self._ready(True)
 
-    def _read_data(self, count):
-        """Read a specified count of bytes from the PN532."""
-        # Build a read request frame.
-        frame = bytearray(count+1)
-        # Add the SPI data read signal byte, but LSB'ify it
-        frame[0] = reverse_bit(_SPI_DATAREAD)
-        time.sleep(0.02)   # required
-        self.CSB.off()
-        time.sleep_ms(2)
-        self._spi.write_readinto(frame, frame)
-        time.sleep_ms(2)
-        self.CSB.on()
-        for i, val in enumerate(frame):
-            frame[i] = reverse_bit(val)  # turn LSB data to MSB
+    async def _wait_ready_async(self, timeout=1000):
+        """Like _wait_ready, but yields to other uasyncio tasks while waiting."""
+        timestamp = time.ticks_ms()
+        backstop = timestamp
+        while time.ticks_diff(time.ticks_ms(), timestamp) < timeout:
+            poll = time.ticks_diff(time.ticks_ms(), backstop) >= _IRQ_BACKSTOP_MS
+            if poll:
+                backstop = time.ticks_ms()
+            if self._ready(poll):
+                return True
+            if self._irq is None:
+                await asyncio.sleep_ms(max(1, self._ready_poll_us // 1000))
+            else:
+                await asyncio.sleep_ms(1)
+        return self._ready(True)
+
+    def _read_into(self, data):
+        """Read len(data) bytes from the PN532 into data, a memoryview of the
+        start of the receive buffer, and return it."""
+        self._irq_flag = False  # reading the frame releases IRQ
+        # Send the LSB'ified data read signal byte, then clock in the frame.
+        self._transfer(_DATAREAD_LSB, data)
+        _reverse_bytes(data, len(data))  # turn LSB data to MSB
         if self.debug:
-            print("DEBUG: _read_data: ", [hex(i) for i in frame[1:]])
-        return frame[1:]   # don't return the status byte
+            print("DEBUG: _read_into: ", [hex(i) for i in data])
+        return data
 
     def _write_data(self, framebytes):
         """Write a specified count of bytes to the PN532"""
-        # start by making a frame with data write in front,
-        # then rest of bytes, and LSBify it
-        rev_frame = [reverse_bit(x)
-                     for x in bytes([_SPI_DATAWRITE]) + framebytes]
+        count = len(framebytes)
+        self._tx[1:count+1] = framebytes
+        self._send(count)
+
+    def _send(self, count, start=0):
+        """Write the count bytes staged at _tx[start+1:] to the PN532."""
+        count += 1
+        tx = self._tx_mv[start:start+count]
+        # put the data write signal in front of the frame, then LSBify it
+        tx[0] = _SPI_DATAWRITE
         if self.debug:
-            print("DEBUG: _write_data: ", [hex(i) for i in rev_frame])
-        time.sleep(0.02)   # required
-        self.CSB.off()
-        time.sleep_ms(2)
-        self._spi.write(bytes(rev_frame))  # pylint: disable=no-member
-        time.sleep_ms(2)
-        self.CSB.on()
+            print("DEBUG: _write_data: ", [hex(i) for i in tx[1:]])
+        _reverse_bytes(tx, count)
+        self._irq_flag = False
+        self._transfer(tx)
+
+    def _abort(self):
+        """Send an ACK frame, which makes the PN532 abort the command it is
+        currently processing."""
+        self._write_data(_ACK)
 
-    def _write_frame(self, data):
-        """Write a frame to the PN532 with the specified data bytearray."""
-        assert data is not None and 1 < len(
-            data) < 255, 'Data must be array of 1 to 255 bytes.'
+    def _send_frame(self, length):
+        """Frame and send the length data bytes already staged in the transmit
+        buffer at _TX_DATA. Frames with more than 254 data bytes are sent as
+        extended information frames."""
         # Build frame to send as:
         # - Preamble (0x00)
         # - Start code  (0x00, 0xFF)
-        # - Command length (1 byte)
+        # - Command length (1 byte), or 0xFF 0xFF and 2 bytes if extended
         # - Command length checksum
         # - Command bytes
         # - Checksum
         # - Postamble (0x00)
-        length = len(data)
-        frame = bytearray(length+8)
-        frame[0] = _PREAMBLE
-        frame[1] = _STARTCODE1
-        frame[2] = _STARTCODE2
-        checksum = sum(frame[0:3])
-        frame[3] = length & 0xFF
-        frame[4] = (~length + 1) & 0xFF
-        frame[5:-2] = data
-        checksum += sum(data)
-        frame[-2] = ~checksum & 0xFF
-        frame[-1] = _POSTAMBLE
+        tx = self._tx
+        if length < 0xFF:
+            start = 3
+            tx[7] = length
+            tx[8] = (~length + 1) & 0xFF
+        else:
+            start = 0
+            tx[4] = 0xFF
+            tx[5] = 0xFF
+            tx[6] = length >> 8
+            tx[7] = length & 0xFF
+            tx[8] = (~(tx[6] + tx[7]) + 1) & 0xFF
+        tx[start+1] = _PREAMBLE
+        tx[start+2] = _STARTCODE1
+        tx[start+3] = _STARTCODE2
+        checksum = _PREAMBLE + _STARTCODE1 + _STARTCODE2
+        end = _TX_DATA + length
+        for i in range(_TX_DATA, end):
+            checksum += tx[i]
+        tx[end] = ~checksum & 0xFF
+        tx[end+1] = _POSTAMBLE
         # Send frame.
         if self.debug:
-            print('DEBUG: _write_frame: ', [hex(i) for i in frame])
-        self._write_data(bytes(frame))
-
-    def _read_frame(self, length):
-        """Read a response frame from the PN532 of at most length bytes in size.
-        Returns the data inside the frame if found, otherwise raises an exception
-        if there is an error parsing the frame.  Note that less than length bytes
-        might be returned!
-        """
-        # Read frame with expected length of data.
-        response = self._read_data(length+8)
-        if self.debug:
-            print('DEBUG: _read_frame:', [hex(i) for i in response])
+            print('DEBUG: _send_frame: ', [hex(i) for i in tx[start+1:end+2]])
+        self._send(end + 1 - start, start)
 
-        # Swallow all the 0x00 values that preceed 0xFF.
-        offset = 0
-        while response[offset] == 0x00:
-            offset += 1
-            if offset >= len(response):
+    def _clock_in(self, data):
+        """Clock len(data) bytes into data, a memoryview of the receive buffer,
+        while chip select is asserted, and turn them from LSB to MSB."""
+        self._spi.readinto(data)
+        _reverse_bytes(data, len(data))
+
+    def _read_frame_at(self):
+        """Read a response frame from the PN532. The header is read first to
+        learn the frame length, then exactly the rest of the frame is clocked
+        in under the same chip select, so nothing is cut short or read in
+        vain. Normal and extended information frames are supported. Returns
+        where the data inside the frame is in the receive buffer as (offset,
+        length), otherwise raises an exception if there is an error parsing
+        the frame.
+        """
+        self._irq_flag = False  # reading the frame releases IRQ
+        rx = self._rx
+        rx_mv = self._rx_mv
+        start = self._select()
+        try:
+            self._spi.write(_DATAREAD_LSB)
+            # Preamble, start code, LEN and LCS.
+            read = _FRAME_HEAD
+            self._clock_in(self._head_mv)
+            # Swallow all the 0x00 values that preceed 0xFF.
+            offset = 0
+            while rx[offset] == 0x00:
+                offset += 1
+                if offset >= _SPI_BUF_LEN - 3:
+                    raise RuntimeError(
+                        'Response frame preamble does not contain 0x00FF!')
+                if offset + 3 > read:  # need 0xFF, LEN and LCS after it
+                    self._clock_in(rx_mv[read:read+1])
+                    read += 1
+            if rx[offset] != 0xFF:
                 raise RuntimeError(
                     'Response frame preamble does not contain 0x00FF!')
-        if response[offset] != 0xFF:
-            raise RuntimeError(
-                'Response frame preamble does not contain 0x00FF!')
-        offset += 1
-        if offset >= len(response):
-            raise RuntimeError('Response contains no data!')
-        # Check length & length checksum match.
-        frame_len = response[offset]
-        if (frame_len + response[offset+1]) & 0xFF != 0:
-            raise RuntimeError(
-                'Response length checksum did not match length!')
+            offset += 1
+            # Check length & length checksum match.
+            frame_len = rx[offset]
+            if frame_len == 0xFF and rx[offset+1] == 0xFF:
+                # Extended frame: LENm, LENl and LCS follow.
+                extra = offset + 5 - read
+                if extra > 0:
+                    self._clock_in(rx_mv[read:read+extra])
+                    read += extra
+                frame_len = (rx[offset+2] << 8) | rx[offset+3]
+                if (rx[offset+2] + rx[offset+3] + rx[offset+4]) & 0xFF != 0:
+                    raise RuntimeError(
+                        'Response length checksum did not match length!')
+                offset += 5
+            else:
+                if (frame_len + rx[offset+1]) & 0xFF != 0:
+                    raise RuntimeError(
+                        'Response length checksum did not match length!')
+                offset += 2
+            # Read the data, DCS and postamble.
+            end = offset + frame_len + 2
+            if end > _SPI_BUF_LEN:
+                raise RuntimeError('Response frame is too long!')
+            if end > read:
+                self._clock_in(rx_mv[read:end])
+        finally:
+            self._deselect(start)
+        if self.debug:
+            print('DEBUG: _read_frame_at:', [hex(i) for i in rx[:end]])
         # Check frame checksum value matches bytes.
-        checksum = sum(response[offset+2:offset+2+frame_len+1]) & 0xFF
-        if checksum != 0:
+        checksum = 0
+        for i in range(offset, offset+frame_len+1):
+            checksum += rx[i]
+        if checksum & 0xFF != 0:
             raise RuntimeError(
                 'Response checksum did not match expected value: ', checksum)
-        # Return frame data.
-        return response[offset+2:offset+2+frame_len]
+        return offset, frame_len
 
     def call_function(self, command, response_length=0, params=[], timeout=1000):  # pylint: disable=dangerous-default-value
-        """Send specified command to the PN532 and expect up to response_length
-        bytes back in a response.  Note that less than the expected bytes might
-        be returned!  Params can optionally specify an array of bytes to send as
-        parameters to the function call.  Will wait up to timeout seconds
-        for a response and return a bytearray of response bytes, or None if no
-        response is available within the timeout.
+        """Send specified command to the PN532 and return its response.  The
+        whole response frame is always read, whatever its size, so
+        response_length is only a hint kept for compatibility.  Params can
+        optionally specify an array of bytes to send as parameters to the
+        function call.  Will wait up to timeout seconds for a response and
+        return a memoryview of the response bytes, or None if no response is
+        available within the timeout. The memoryview points into the driver's
+        receive buffer and is only valid until the next command.
+
+        Frames are built and parsed in the driver's own buffers, so besides
+        the params passed in a command only allocates three small memoryview
+        objects: for the frame sent, the response read and the response
+        returned (the SPI calls take no offsets). benchmarks.py measures it.
+
+        Bus and protocol errors (a failed write, a missing ACK, a garbled
+        frame) are recovered from in tiers, each tried once: resync (NACK to
+        get a garbled response again, or ACK to abort and resend), soft
+        re-init, then a hardware reset through the RST pin. If all of them
+        fail None is returned and the error is kept in last_error.
         """
-        # Build frame data with command and parameters.
-        data = bytearray(2+len(params))
-        data[0] = _HOSTTOPN532
-        data[1] = command & 0xFF
-        for i, val in enumerate(params):
-            data[2+i] = val
-        # Send frame and wait for response.
         try:
-            self._write_frame(data)
+            return self._call(command, params, timeout)
+        except (OSError, RuntimeError) as e:
+            error = e
+        for tier in range(_RECOVERY_TIERS):
+            if self.debug:
+                print('DEBUG: call_function recovery tier', tier, 'after', error)
+            try:
+                if tier == _RECOVERY_RESYNC and self._response_pending:
+                    self._recoveries[tier] += 1
+                    return self._reread_response(command)
+                if not self._recover(tier):
+                    continue
+                return self._call(command, params, timeout)
+            except (OSError, RuntimeError) as e:
+                error = e
+        self.last_error = error
+        return None
+
+    def _call(self, command, params, timeout):
+        """call_function without error recovery: bus and protocol errors are
+        raised as OSError/RuntimeError."""
+        stats = self._stats
+        stats.start(command)
+        self._response_pending = False
+        try:
+            if not self._send_command(command, params):
+                raise OSError('PN532 bus write failed')
+            stats.mark()
+            # The ACK follows within a millisecond or two, whatever the timeout.
+            if not self._wait_ready(min(timeout, _ACK_TIMEOUT)):
+                stats.mark()
+                raise RuntimeError('No ACK from PN532')
+            # Verify ACK response and wait to be ready for function response.
+            self._read_ack()
+            stats.mark()
+            if not self._wait_ready(timeout):
+                if(self.debug):
+                    print('DEBUG: _wait_ready timed out waiting for response')
+                self._abort()  # don't leave the PN532 busy with a stale command
+                stats.mark()
+                stats.finish(_STAT_TIMEOUTS)
+                return None
+            stats.mark()
+            self._response_pending = True
+            response = self._read_response(command)
+            self._response_pending = False
+        except Exception:
+            stats.finish(_STAT_ERRORS)
+            raise
+        stats.mark()
+        stats.finish(_status_counter(command, response))
+        return response
+
+    def _reread_response(self, command):
+        """Ask the PN532 to send its last response frame again with a NACK and
+        read it, for a response that arrived garbled."""
+        self._write_data(_NACK)
+        if not self._wait_ready(_ACK_TIMEOUT):
+            raise RuntimeError('No response to NACK')
+        response = self._read_response(command)
+        self._response_pending = False
+        return response
+
+    def _recover(self, tier):
+        """Bring the PN532 back to a state where it takes commands, using
+        recovery tier `tier` (_RECOVERY_*). Returns False if the tier is not
+        available (no RST pin)."""
+        if tier == _RECOVERY_RESET and self._reset_pin is None:
+            return False
+        self._recoveries[tier] += 1
+        self._auth = None
+        self._held_auth = None
+        if tier == _RECOVERY_RESYNC:
+            # ACK aborts whatever the PN532 is doing and drops its output.
+            self._abort()
+            time.sleep_us(_RESYNC_US)
+            self._irq_flag = False
+            return True
+        if tier == _RECOVERY_RESET:
+            _reset(self._reset_pin, _RESET_LOW_MS, _RESET_SETTLE_MS)
+        # Soft re-init: wake up and set up again what a reset loses.
+        self._wake()
+        self._call(_COMMAND_SAMCONFIGURATION, _SAM_PARAMS, _REINIT_TIMEOUT)
+        if self._passive_retries is not None:
+            self._call(_COMMAND_RFCONFIGURATION,
+                       (_RFCONFIG_MAX_RETRIES, 0xFF, 0x01, self._passive_retries),
+                       _REINIT_TIMEOUT)
+        return True
+
+    def recovery_stats(self, reset=False):
+        """Return a tuple of how many times each error recovery tier ran:
+        resyncs, soft re-inits and hardware resets. Pass reset=True to start
+        counting afresh."""
+        stats = tuple(self._recoveries)
+        if reset:
+            for tier in range(_RECOVERY_TIERS):
+                self._recoveries[tier] = 0
+        return stats
+
+    def _send_command(self, command, params):
+        """Build the frame for command and params straight into the transmit
+        buffer and send it. Returns False if the bus write failed."""
+        assert len(params) <= _MAX_FRAME_DATA - 2, 'Params must be array of at most 263 bytes.'
+        # Only a successful InDataExchange keeps the MiFare auth session; a
+        # reselect, error or anything else may have reset the card's state.
+        self._held_auth = self._auth
+        self._auth = None
+        if self._powered_down:
+            self._wake()
+        tx = self._tx
+        tx[_TX_DATA] = _HOSTTOPN532
+        tx[_TX_DATA+1] = command & 0xFF
+        for i in range(len(params)):
+            tx[_TX_DATA+2+i] = params[i]
+        try:
+            self._send_frame(2+len(params))
         except OSError:
-            self._wakeup()
-            return None
-        if not self._wait_ready(timeout):
-            if(self.debug):
-                print('DEBUG: _wait_ready timed out waiting for ACK')
-            return None
-        # Verify ACK response and wait to be ready for function response.
-        if not _ACK == self._read_data(len(_ACK)):
-            raise RuntimeError('Did not receive expected ACK from PN532!')
-        if not self._wait_ready(timeout):
-            if(self.debug):
-                print('DEBUG: _wait_ready timed out waiting for response')
-            return None
-        # Read response bytes.
-        response = self._read_frame(response_length+2)
+            return False
+        return True
+
+    def _read_ack(self):
+        """Read the ACK frame that acknowledges a command."""
+        ack = self._read_into(self._ack_mv)
+        for i in range(len(_ACK)):
+            if ack[i] != _ACK[i]:
+                raise RuntimeError('Did not receive expected ACK from PN532!')
+
+    def _read_response(self, command):
+        """Read the response frame to command and return its data after the
+        TFI and response code."""
+        offset, frame_len = self._read_frame_at()
+        rx = self._rx
         if(self.debug):
-            print('DEBUG: call_function response:', [hex(i) for i in response])
+            print('DEBUG: call_function response:',
+                  [hex(i) for i in rx[offset:offset+frame_len]])
         # Check that response is for the called function.
-        if not (response[0] == _PN532TOHOST and response[1] == (command+1)):
+        if not (frame_len >= 2 and rx[offset] == _PN532TOHOST and
+                rx[offset+1] == (command+1)):
             raise RuntimeError('Received unexpected command response!')
+        if command == _COMMAND_INDATAEXCHANGE and frame_len > 2 and rx[offset+2] & 0x3F == 0:
+            self._auth = self._held_auth
         # Return response data.
-        return response[2:]
+        return self._rx_mv[offset+2:offset+frame_len]
 
-    def get_firmware_version(self):
+    def get_firmware_version(self, refresh=False):
         """Call PN532 GetFirmwareVersion function and return a tuple with the IC,
-        Ver, Rev, and Support values.
+        Ver, Rev, and Support values. The version read by begin() is returned
+        without asking the PN532 again unless refresh=True.
         """
+        if self.firmware_version is not None and not refresh:
+            return self.firmware_version
         response = self.call_function(
             _COMMAND_GETFIRMWAREVERSION, 4, timeout=500)
         if response is None:
             raise RuntimeError('Failed to detect the PN532')
-        return tuple(response)
+        self.firmware_version = tuple(response)
+        return self.firmware_version
 
     def SAM_configuration(self):   # pylint: disable=invalid-name
         """Configure the PN532 to read MiFare cards."""
@@ -312,32 +1130,225 @@ class PN532:
         # - 0x01, use IRQ pin
         # Note that no other verification is necessary as call_function will
         # check the command was executed as expected.
-        self.call_function(_COMMAND_SAMCONFIGURATION,
-                           params=[0x01, 0x14, 0x01])
+        self.call_function(_COMMAND_SAMCONFIGURATION, params=_SAM_PARAMS)
+
+    def power_down(self, wake=POWERDOWN_WAKE_SPI, generate_irq=False):
+        """Put the PN532 in its PowerDown (soft power down) state until one of
+        the `wake` sources (POWERDOWN_WAKE_* bits) wakes it. With
+        generate_irq=True it pulls IRQ low once it is awake again, so a
+        sleeping host can be woken by the PN532 too. The next command wakes
+        it over SPI automatically. Returns True if the PN532 went down."""
+        params = [wake & 0xFF, 0x01] if generate_irq else [wake & 0xFF]
+        response = self.call_function(_COMMAND_POWERDOWN, params=params)
+        if response is None or response[0] & 0x3F:
+            return False
+        self._powered_down = True
+        self._power_downs += 1
+        self._down_since = time.ticks_ms()
+        return True
+
+    def standby(self):
+        """Switch the RF field off and power the PN532 down, for when the
+        reader has nothing to do. Any later command wakes it up again."""
+        self.rf_field(False)
+        return self.power_down()
+
+    def _wake(self):
+        """Wake the PN532 from PowerDown: any SPI traffic with chip select
+        low wakes it, after which it needs a moment before the next frame."""
+        self._transfer(_STATREAD_LSB, self._status)
+        time.sleep_ms(_POWER_DOWN_WAKE_MS)
+        self._irq_flag = False
+        if self._powered_down:
+            self._powered_down = False
+            self._down_ms += time.ticks_diff(time.ticks_ms(), self._down_since)
+
+    def power_stats(self, reset=False):
+        """Return a tuple of how many times the PN532 was powered down and
+        the total milliseconds it spent powered down, including the current
+        power down. Pass reset=True to start counting afresh."""
+        down_ms = self._down_ms
+        if self._powered_down:
+            down_ms += time.ticks_diff(time.ticks_ms(), self._down_since)
+        count = self._power_downs
+        if reset:
+            self._power_downs = 0
+            self._down_ms = 0
+            self._down_since = time.ticks_ms()
+        return count, down_ms
+
+    def set_max_retries(self, passive_activation, atr=0xFF, psl=0x01):
+        """Set how many times the PN532 retries ATR_REQ, PSL_REQ and passive
+        activation (InListPassiveTarget) before giving up. 0xFF retries
+        forever, 0x00 tries only once."""
+        self.call_function(_COMMAND_RFCONFIGURATION,
+                           params=[_RFCONFIG_MAX_RETRIES, atr, psl,
+                                   passive_activation])
+        self._passive_retries = passive_activation
+
+    def wait_for_card(self, timeout=5000, card_baud=_MIFARE_ISO14443A):
+        """Wait up to timeout milliseconds for a card and return its UID as
+        soon as it enters the field, or None. The PN532 is set to retry
+        passive activation forever, so it does the polling itself and the
+        host only waits for the response (on the IRQ line when available)
+        instead of issuing a new command every few hundred milliseconds.
+        """
+        if self._passive_retries != 0xFF:
+            self.set_max_retries(0xFF)
+        return self.read_passive_target(card_baud=card_baud, timeout=timeout)
 
     def read_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1000):
         """Wait for a MiFare card to be available and return its UID when found.
         Will wait up to timeout seconds and return None if no card is found,
         otherwise a bytearray with the UID of the found card is returned.
         """
-        # Send passive read command for 1 card.  Expect at most a 7 byte UUID.
-        try:
-            response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
-                                          params=[0x01, card_baud],
-                                          response_length=19,
-                                          timeout=timeout)
-        except BusyError:
-            return None  # no card found!
-        # If no response is available return None to indicate no card is present.
-        if response is None:
+        # Send passive read command for 1 card.  Expect at most a 10 byte UID.
+        response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
+                                      params=_poll_params(card_baud),
+                                      response_length=19,
+                                      timeout=timeout)
+        self._note_target(response, card_baud)
+        return _passive_target_uid(response, card_baud)
+
+    def _note_target(self, response, card_baud=_MIFARE_ISO14443A):
+        """Remember the target number, ATQA and SAK from an
+        InListPassiveTarget response for one card."""
+        if response is not None and response[0]:
+            self._tg = response[1]
+            self._targets = []
+            self._bystanders = []
+            if card_baud != _MIFARE_ISO14443A:
+                self._card_type = None
+                return
+            self._card_type = (response[2] << 16) | (response[3] << 8) | response[4]
+            self._uid_length = response[5]
+
+    def list_targets(self, max_targets=_MAX_TARGETS, timeout=1000):
+        """Look for up to max_targets (at most 2) ISO14443A cards at once and
+        return a list with a Target for each card found, empty if there is
+        none. The first card is selected; pick another with select_target.
+        FeliCa cards are found with read_passive_target.
+        """
+        assert 0 < max_targets <= _MAX_TARGETS, 'The PN532 lists at most 2 targets!'
+        response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
+                                      params=[max_targets, _MIFARE_ISO14443A],
+                                      timeout=timeout)
+        targets = _parse_targets(response)
+        self._targets = targets
+        if targets:
+            self._use_target(targets[0])
+        return targets
+
+    def select_target(self, target):
+        """Make target (one of the cards the last list_targets call found) the
+        card that later commands talk to. The other cards are released, so
+        raw frames sent with InCommunicateThru reach the chosen card too, and
+        remembered as bystanders that selecting the card again skips."""
+        self._bystanders = [other.uid for other in self._targets if other.tg != target.tg]
+        for other in self._targets:
+            if other.tg != target.tg:
+                self.release_targets(other.tg)
+        self._targets = [target]
+        self._use_target(target)
+
+    def _use_target(self, target):
+        self._tg = target.tg
+        self._card_type = (target.atqa << 8) | target.sak
+        self._uid_length = len(target.uid)
+
+    def card_info(self):
+        """Return the family and capabilities (see classify()) of the card
+        selected last, or (CARD_UNKNOWN, 0) if there is none."""
+        if self._card_type is None:
+            return CARD_UNKNOWN, 0
+        return classify(self._card_type >> 8, self._card_type & 0xFF, self._uid_length)
+
+    def _lacks(self, capability):
+        """True if the selected card is of a known family that doesn't have
+        capability, so commands needing it can't work."""
+        family, caps = self.card_info()
+        return family != CARD_UNKNOWN and not caps & capability
+
+    def _select_again(self, *uids):
+        """Select the card being worked on again after it was halted or its
+        field was reset, and return its UID (None if it is gone). Bystander
+        cards are left out, one per UID, since a card being cloned can come
+        back with the same UID as the source card next to it; of the rest the
+        card with the first of uids that is found is preferred."""
+        targets = self.list_targets(timeout=_RESELECT_TIMEOUT)
+        candidates = list(targets)
+        for uid in self._bystanders:
+            for target in candidates:
+                if target.uid == uid:
+                    candidates.remove(target)
+                    break
+        if not candidates:
             return None
-        # Check only 1 card with up to a 7 byte UID is present.
-        if response[0] != 0x01:
-            raise RuntimeError('More than one card detected!')
-        if response[5] > 7:
-            raise RuntimeError('Found card with unexpectedly long UID!')
-        # Return UID of card.
-        return response[6:6+response[5]]
+        chosen = candidates[0]
+        for uid in uids:
+            match = [target for target in candidates if target.uid == uid]
+            if match:
+                chosen = match[0]
+                break
+        if len(targets) > 1:
+            self.select_target(chosen)
+        return chosen.uid
+
+    def set_bitrate(self, bitrate, target=None):
+        """Switch the RF bit rate to and from the selected card (or target, a
+        Target from list_targets) to one of the BITRATE_ values with InPSL.
+        ISO14443-4 cards take it only right after being selected, and only
+        the rates their ATS lists (see max_bitrate); FeliCa cards switch
+        between 212 and 424 kbps. The rate holds until the card is selected
+        again. Returns True if the card took it.
+        """
+        tg = self._tg if target is None else target.tg
+        response = self.call_function(_COMMAND_INPSL, params=[tg, bitrate, bitrate])
+        return response is not None and len(response) > 0 and response[0] & 0x3F == 0
+
+    def rf_field(self, on):
+        """Switch the RF field on or off. Switching it off resets every card
+        in the field; the next InListPassiveTarget switches it back on."""
+        self.call_function(_COMMAND_RFCONFIGURATION,
+                           params=[_RFCONFIG_FIELD, 0x01 if on else 0x00])
+
+    def _reselect(self, *uids):
+        """Power cycle the cards in the field and select one again, as
+        _select_again. Works for halted cards too. Returns its UID or None."""
+        self.rf_field(False)
+        time.sleep_ms(_FIELD_RESET_MS)
+        return self._select_again(*uids)
+
+    def write_registers(self, values):
+        """Write PN532 registers. values is a flat sequence of (address,
+        value) pairs, with 16-bit addresses, e.g. [0x633D, 0x07]."""
+        params = bytearray(len(values) // 2 * 3)
+        for i in range(0, len(values), 2):
+            j = i // 2 * 3
+            params[j] = values[i] >> 8
+            params[j + 1] = values[i] & 0xFF
+            params[j + 2] = values[i + 1]
+        return self.call_function(_COMMAND_WRITEREGISTER, params=params) is not None
+
+    def read_registers(self, addresses):
+        """Read PN532 registers given by 16-bit address. Returns a bytearray
+        with one value per address, or None."""
+        params = bytearray(2 * len(addresses))
+        for i, address in enumerate(addresses):
+            params[2 * i] = address >> 8
+            params[2 * i + 1] = address & 0xFF
+        response = self.call_function(_COMMAND_READREGISTER, params=params)
+        if response is None or len(response) < len(addresses):
+            return None
+        return bytearray(response[len(response) - len(addresses):])
+
+    def release_targets(self, target=0):
+        """Release target number `target` (0 for all of them) with
+        InRelease. The card is halted and only answers again after the RF
+        field is switched off and on (see rf_field). Returns True on
+        success."""
+        response = self.call_function(_COMMAND_INRELEASE, params=[target & 0xFF])
+        return response is not None and response[0] & 0x3F == 0
 
     def ntag2xx_write_block(self, block_number, data):
         """Write a block of data to the card.  Block number should be the block
@@ -349,7 +1360,7 @@ class PN532:
             data) == 4, 'Data must be an array of 4 bytes!'
         # Build parameters for InDataExchange command to do NTAG203 classic write.
         params = bytearray(3+len(data))
-        params[0] = 0x01  # Max card numbers
+        params[0] = self._tg
         params[1] = MIFARE_ULTRALIGHT_CMD_WRITE
         params[2] = block_number & 0xFF
         params[3:] = data
@@ -372,15 +1383,178 @@ class PN532:
             return data[0:4] # only 4 bytes per page for NTAG
         return None
 
+    def ntag2xx_page_count(self):
+        """Send GET_VERSION and return the total number of pages of an
+        NTAG213/215/216, or None if the tag didn't answer or is unknown.
+        """
+        response = self.call_function(_COMMAND_INCOMMUNICATETHRU,
+                                      params=[NTAG_CMD_GET_VERSION],
+                                      response_length=9)
+        if response is None or response[0] != 0x00 or len(response) != 9:
+            return None
+        return _NTAG_PAGES.get(response[7])
+
+    def ntag2xx_read_pages(self, start, count, buf=None, fast=True):
+        """Read count 4-byte pages starting at page start into buf (a bytearray
+        of at least 4*count bytes, allocated if not given) and return it, or
+        None if a read fails. With fast=True FAST_READ fetches up to 60 pages
+        per frame; otherwise READ is used, which returns 4 pages per frame.
+        """
+        if buf is None:
+            buf = bytearray(4 * count)
+        page = start
+        end = start + count
+        while page < end:
+            offset = 4 * (page - start)
+            if fast:
+                chunk = min(_FAST_READ_PAGES, end - page)
+                response = self.call_function(_COMMAND_INCOMMUNICATETHRU,
+                                              params=[NTAG_CMD_FAST_READ, page,
+                                                      page + chunk - 1],
+                                              response_length=1 + 4 * chunk)
+            else:
+                chunk = min(4, end - page)
+                response = self.call_function(_COMMAND_INDATAEXCHANGE,
+                                              params=[self._tg, MIFARE_CMD_READ,
+                                                      page & 0xFF],
+                                              response_length=17)
+            if (response is None or response[0] != 0x00
+                    or len(response) < 1 + 4 * chunk):
+                return None
+            buf[offset:offset + 4 * chunk] = response[1:1 + 4 * chunk]
+            page += chunk
+        return buf
+
+    def ntag2xx_dump(self):
+        """Read the whole memory of an NTAG2xx in as few frames as possible and
+        return it as a bytearray (4 bytes per page), or None on failure.
+        Tags that don't support GET_VERSION/FAST_READ (MIFARE Ultralight) are
+        read as 16 pages using READ. Cards known not to be paged (see
+        card_info) get None at once.
+        """
+        if self._lacks(CAP_PAGES):
+            return None
+        pages = self.ntag2xx_page_count()
+        if pages is not None:
+            return self.ntag2xx_read_pages(0, pages)
+        # The tag NAKed GET_VERSION and went back to idle, select it again.
+        if self.read_passive_target(timeout=100) is None:
+            return None
+        return self.ntag2xx_read_pages(0, _ULTRALIGHT_PAGES, fast=False)
+
+    def apdu_exchange(self, apdu, into, timeout=1000):
+        """Send an ISO14443-4 command APDU to the selected card (one with
+        CAP_ISO_DEP, see card_info) and write its response APDU, status word
+        included, into the buffer into. A command longer than one
+        InDataExchange is sent in parts chained with the MI bit, and a long
+        response is collected part by part, each in one (extended) frame,
+        for as long as the PN532 sets MI. Returns the response length, or
+        None if the exchange failed. Raises RuntimeError if the response
+        does not fit in into.
+        """
+        tg = self._tg
+        apdu = memoryview(apdu)
+        params = bytearray(1 + min(len(apdu), _MAX_EXCHANGE_DATA))
+        sent = 0
+        while True:
+            chunk = min(len(apdu) - sent, _MAX_EXCHANGE_DATA)
+            more = sent + chunk < len(apdu)
+            params[0] = tg | _MORE_INFORMATION if more else tg
+            params[1:1 + chunk] = apdu[sent:sent + chunk]
+            response = self.call_function(_COMMAND_INDATAEXCHANGE,
+                                          params=memoryview(params)[:1 + chunk],
+                                          timeout=timeout)
+            if response is None or response[0] & 0x3F:
+                return None
+            sent += chunk
+            if not more:
+                break
+        received = 0
+        while True:
+            part = len(response) - 1
+            if received + part > len(into):
+                raise RuntimeError('APDU response does not fit in the buffer!')
+            into[received:received + part] = response[1:]
+            received += part
+            if not response[0] & _MORE_INFORMATION:
+                return received
+            response = self.call_function(_COMMAND_INDATAEXCHANGE, params=(tg,),
+                                          timeout=timeout)
+            if response is None or response[0] & 0x3F:
+                return None
+
+    def _apdu_ok(self, apdu, into):
+        """apdu_exchange, returning the length of the response data without
+        the status word, or None unless the status word is 9000."""
+        count = self.apdu_exchange(apdu, into)
+        if count is None or count < 2 or (into[count - 2] << 8) | into[count - 1] != _SW_OK:
+            return None
+        return count - 2
+
+    def type4_read_ndef(self, into=None):
+        """Read the NDEF message of an NFC Forum Type 4 tag (DESFire with an
+        NDEF application, NTAG 424 DNA, ...) into the bytearray into,
+        allocated if not given, and return it trimmed to the message length
+        as a memoryview, or None if there is no NDEF file to read. The
+        capability container gives the largest read the tag allows; tags
+        that take more than 255 bytes are read with extended length APDUs,
+        so a message usually comes in with a single READ BINARY.
+        """
+        scratch = bytearray(_CC_LEN + 2)
+        # SELECT the NDEF application, then the capability container.
+        if (self._apdu_ok(b'\x00\xA4\x04\x00\x07' + _NDEF_APP + b'\x00', scratch) is None
+                or self._apdu_ok(b'\x00\xA4\x00\x0C\x02' + _CC_FILE, scratch) is None
+                or self._apdu_ok(bytes((0x00, 0xB0, 0x00, 0x00, _CC_LEN)), scratch) != _CC_LEN):
+            return None
+        max_read = (scratch[3] << 8) | scratch[4]
+        # SELECT the NDEF file named in the CC and read its length (NLEN).
+        if (self._apdu_ok(b'\x00\xA4\x00\x0C\x02' + bytes(scratch[9:11]), scratch) is None
+                or self._apdu_ok(b'\x00\xB0\x00\x00\x02', scratch) != 2):
+            return None
+        length = (scratch[0] << 8) | scratch[1]
+        if into is None:
+            into = bytearray(length)
+        elif len(into) < length:
+            raise RuntimeError('NDEF message does not fit in the buffer!')
+        chunk = min(max_read, length)
+        part = bytearray(chunk + 2)
+        read_binary = bytearray(b'\x00\xB0\x00\x00\x00\x00\x00')
+        offset = 0
+        while offset < length:
+            count = min(chunk, length - offset)
+            read_binary[2] = (offset + 2) >> 8
+            read_binary[3] = (offset + 2) & 0xFF
+            if count > 0xFF:
+                read_binary[4] = 0x00
+                read_binary[5] = count >> 8
+                read_binary[6] = count & 0xFF
+                apdu = read_binary
+            else:
+                read_binary[4] = count
+                apdu = memoryview(read_binary)[:5]
+            if self._apdu_ok(apdu, part) != count:
+                return None
+            into[offset:offset + count] = memoryview(part)[:count]
+            offset += count
+        return memoryview(into)[:length]
+
     def mifare_classic_read_block(self, block_number):
         """Read a block of data from the card.  Block number should be the block
         to read.  If the block is successfully read a bytearray of length 16 with
         data starting at the specified block will be returned.  If the block is
         not read then None will be returned.
         """
+        data = self._mifare_read(block_number)
+        if data is None:
+            return None
+        return bytearray(data)
+
+    def _mifare_read(self, block_number):
+        """Read a 16 byte block and return it as a memoryview into the receive
+        buffer (valid until the next command), or None on failure."""
         # Send InDataExchange request to read block of MiFare data.
         response = self.call_function(_COMMAND_INDATAEXCHANGE,
-                                      params=[0x01, MIFARE_CMD_READ,
+                                      params=[self._tg, MIFARE_CMD_READ,
                                               block_number & 0xFF],
                                       response_length=17)
         # Check first response is 0x00 to show success.
@@ -405,7 +1579,7 @@ class PN532:
         
         # Build parameters for InDataExchange command
         params = bytearray(3 + 16)
-        params[0] = 0x01  # Target number (always 1)
+        params[0] = self._tg
         params[1] = MIFARE_CMD_WRITE
         params[2] = block_number & 0xFF
         params[3:] = data
@@ -436,21 +1610,305 @@ class PN532:
         the block to authenticate, key number should be the key type (like
         MIFARE_CMD_AUTH_A or MIFARE_CMD_AUTH_B), and key should be a byte array
         with the key data.  Returns True if the block was authenticated, or False
-        if not authenticated.
+        if not authenticated.  If the card is still authenticated for the
+        block's sector with the same key no command is sent at all, and if
+        the selected card is known not to be a MiFare classic (see
+        card_info) False is returned without trying. Cards with 7 or 10 byte
+        UIDs authenticate with the last 4 bytes.
         """
+        sector = _mifare_sector(block_number)
+        auth = self._auth
+        if (auth is not None and auth[1] == sector and auth[2] == key_number
+                and auth[0] == uid and auth[3] == key):
+            return True
+        if self._lacks(CAP_CLASSIC):
+            return False
         # Build parameters for InDataExchange command to authenticate MiFare card.
-        uidlen = len(uid)
         keylen = len(key)
-        params = bytearray(3 + uidlen + keylen)
-        params[0] = 0x01  # Max card numbers
+        params = bytearray(3 + 4 + keylen)
+        params[0] = self._tg
         params[1] = key_number & 0xFF
         params[2] = block_number & 0xFF
         params[3 : 3 + keylen] = key
-        params[3 + keylen :] = uid
+        params[3 + keylen :] = uid[len(uid) - 4:]
         # Send InDataExchange request and verify response is 0x00.
         response = self.call_function(
             _COMMAND_INDATAEXCHANGE, params=params, response_length=1
         )
-        if response is None:
+        if response is None or response[0] != 0x00:
             return False
-        return response[0] == 0x00
+        self._auth = (bytearray(uid), sector, key_number, bytearray(key))
+        return True
+
+    def mifare_classic_write_verify(self, uid, block_number, data, key_number=MIFARE_CMD_AUTH_B, key=KEY_DEFAULT_B, attempts=3, backoff_ms=20):  # pylint: disable=invalid-name
+        """Write a block of a MiFare classic card and check it was stored, in
+        one pass with the card left in the field: authenticate and write,
+        reset the field and select the card again, authenticate again and
+        read the block back. When writing block 0 of a UID-writable card the
+        card must come back with the UID in `data`. A failed attempt is
+        retried after backoff_ms, doubling each time, up to `attempts` tries;
+        one whose write failed isn't read back. Returns the number of
+        attempts it took, or 0 if the block could not be written and
+        verified.
+        """
+        assert data is not None and len(data) == 16, 'Data must be an array of 16 bytes!'
+        expected = bytearray(data)
+        expected_uid = expected[0:len(uid)] if block_number == 0 else bytearray(uid)
+        current = bytearray(uid)
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep_ms(backoff_ms << (attempt - 1))
+            if current is None or not (
+                    self.mifare_classic_authenticate_block(current, block_number, key_number, key) and
+                    self.mifare_classic_write_block(block_number, data)):
+                # Nothing to check. A failed authentication or write halts the
+                # card, so select it again for the next try.
+                current = self._reselect(uid, expected_uid)
+                continue
+            # Power cycle and select the card again so the check sees what it
+            # stored; a halted card wouldn't answer the PN532's REQA.
+            current = self._reselect(expected_uid, uid)
+            if self._verify_block(current, expected_uid, block_number, expected, key_number, key):
+                return attempt + 1
+        return 0
+
+    def _verify_block(self, uid, expected_uid, block_number, expected, key_number, key):
+        """Check that the freshly selected card with `uid` is expected_uid and
+        that its block holds `expected`, reading it back with the given key."""
+        if uid != expected_uid:
+            return False
+        if not self.mifare_classic_authenticate_block(uid, block_number, key_number, key):
+            # A failed authentication halts the card, select it again.
+            self._reselect(uid)
+            return False
+        stored = self._mifare_read(block_number)
+        return stored is not None and expected == stored
+
+    def _thru_ack(self, data):
+        """Send a raw frame with InCommunicateThru and return True if the card
+        answered with the 4-bit MiFare ACK."""
+        response = self.call_function(_COMMAND_INCOMMUNICATETHRU, params=data,
+                                      timeout=_THRU_TIMEOUT)
+        return (response is not None and len(response) > 1
+                and response[0] & 0x3F == 0 and response[1] & 0x0F == MIFARE_ACK)
+
+    def gen1a_write_block(self, block_number, data):
+        """Write a block of a Gen1a (UID-changeable) MiFare classic card
+        through its backdoor, without authenticating: HALT, the 7-bit 0x40
+        and 0x43 unlock commands, then a normal WRITE. The PN532's CRC
+        handling and bit framing are changed for the raw frames and put back
+        afterwards. Returns True if the card acknowledged the write; the card
+        is left halted, select it again to use it.
+        """
+        assert data is not None and len(data) == 16, 'Data must be an array of 16 bytes!'
+        modes = self.read_registers((_REG_TX_MODE, _REG_RX_MODE))
+        if modes is None:
+            return False
+        frame = bytearray(18)
+        try:
+            self.write_registers((_REG_TX_MODE, modes[0] & ~_CRC_ENABLE & 0xFF,
+                                  _REG_RX_MODE, modes[1] & ~_CRC_ENABLE & 0xFF))
+            # HALT gets no answer; it only has to reach the card.
+            frame[0] = ISO14443A_CMD_HALT
+            frame[1] = 0x00
+            _crc_a(frame, 2)
+            self.call_function(_COMMAND_INCOMMUNICATETHRU, params=frame[:4],
+                               timeout=_THRU_TIMEOUT)
+            self.write_registers((_REG_BIT_FRAMING, 0x07))
+            ok = self._thru_ack((GEN1A_CMD_UNLOCK1,))
+            self.write_registers((_REG_BIT_FRAMING, 0x00))
+            ok = ok and self._thru_ack((GEN1A_CMD_UNLOCK2,))
+            if ok:
+                frame[0] = MIFARE_CMD_WRITE
+                frame[1] = block_number & 0xFF
+                _crc_a(frame, 2)
+                ok = self._thru_ack(frame[:4])
+            if ok:
+                frame[0:16] = data
+                _crc_a(frame, 16)
+                ok = self._thru_ack(frame)
+        finally:
+            self.write_registers((_REG_BIT_FRAMING, 0x00,
+                                  _REG_TX_MODE, modes[0], _REG_RX_MODE, modes[1]))
+        return ok
+
+    def mifare_classic_clone_block0(self, uid, data, key_number=MIFARE_CMD_AUTH_B, key=KEY_DEFAULT_B, attempts=3, backoff_ms=20):  # pylint: disable=invalid-name
+        """Write block 0 (and so the UID) of a UID-changeable MiFare classic
+        card and verify it, whichever kind of blank it is. Gen1a cards are
+        written through their backdoor (gen1a_write_block), direct-write
+        (Gen2) cards with an authenticated write (mifare_classic_write_verify).
+        The strategy that worked is remembered for the card's ATQA and SAK and
+        tried first next time, so a run of cards of the same kind skips the
+        probing. Gen1a, Gen2 and genuine cards all report the same ATQA and
+        SAK though, so the remembered strategy only gets a single attempt
+        before the other one is tried, and the rest of its attempts after
+        that. Returns the number of attempts it took, or 0 if block 0 could
+        not be written and verified (at once for cards known not to be MiFare
+        classics).
+        """
+        if self._lacks(CAP_CLASSIC):
+            return 0
+        card_type = self._card_type
+        first = self._clone_strategies.get(card_type)
+        if first is None:
+            plan = ((CLONE_GEN1A, attempts), (CLONE_DIRECT, attempts))
+        else:
+            other = CLONE_DIRECT if first == CLONE_GEN1A else CLONE_GEN1A
+            plan = ((first, 1), (other, attempts), (first, attempts - 1))
+        for strategy, tries in plan:
+            if tries <= 0:
+                continue
+            if strategy == CLONE_GEN1A:
+                result, uid = self._clone_gen1a(uid, data, key_number, key, tries, backoff_ms)
+            else:
+                result = self.mifare_classic_write_verify(uid, 0, data, key_number, key, tries, backoff_ms)
+            if result:
+                self._clone_strategies[card_type] = strategy
+                return result
+            if uid is None:
+                break  # card gone
+        return 0
+
+    def _clone_gen1a(self, uid, data, key_number, key, attempts, backoff_ms):
+        """Gen1a half of mifare_classic_clone_block0. Returns the attempts it
+        took (0 on failure, at once if the card has no backdoor) and the UID
+        of the card selected again afterwards."""
+        expected = bytearray(data)
+        expected_uid = expected[0:4]
+        current = None
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep_ms(backoff_ms << (attempt - 1))
+            written = self.gen1a_write_block(0, data)
+            current = self._reselect(expected_uid, uid)
+            if not written and attempt == 0:
+                break  # no backdoor
+            if written and self._verify_block(current, expected_uid, 0, expected, key_number, key):
+                return attempt + 1, current
+        return 0, current
+
+    def dump_card(self, uid, sink, key_number=MIFARE_CMD_AUTH_B, key=KEY_DEFAULT_B, sectors=16):  # pylint: disable=invalid-name
+        """Read every block of a MiFare classic card (16 sectors for a 1K card),
+        authenticating once per sector and reading its 4 blocks in that
+        session. sink(block_number, data) is called for each block as soon as
+        it is read; data is a memoryview that is only valid during the call.
+        Returns a list with an (auth_us, read_us) timing tuple per sector, or
+        None for sectors that could not be authenticated or fully read.
+        """
+        if self._lacks(CAP_CLASSIC):
+            return [None] * sectors
+        stats = []
+        for sector in range(sectors):
+            first = sector * 4
+            start = time.ticks_us()
+            if not self.mifare_classic_authenticate_block(uid, first, key_number, key):
+                stats.append(None)
+                # A failed authentication halts the card, select it again.
+                self._reselect(uid)
+                continue
+            auth_us = time.ticks_diff(time.ticks_us(), start)
+            read_us = 0
+            for block in range(first, first + 4):
+                start = time.ticks_us()
+                data = self._mifare_read(block)
+                read_us += time.ticks_diff(time.ticks_us(), start)
+                if data is None:
+                    stats.append(None)
+                    break
+                sink(block, data)
+            else:
+                stats.append((auth_us, read_us))
+        return stats
+
+
+class AsyncPN532:
+    """uasyncio front end for a PN532. Commands yield to other tasks while the
+    PN532 is busy instead of blocking, using the same transport, buffers and
+    MiFare session as the wrapped synchronous driver. Methods without an
+    async version are passed through to the PN532 unchanged.
+
+        apn532 = AsyncPN532(pn532)
+        uid = await apn532.wait_for_card(timeout=5000)
+    """
+
+    def __init__(self, pn532):
+        self._dev = pn532
+
+    def __getattr__(self, name):
+        return getattr(self._dev, name)
+
+    async def call(self, command, params=(), timeout=1000):
+        """Async version of PN532.call_function, with the same error
+        recovery. If the calling task is cancelled while waiting, the command
+        is aborted on the PN532."""
+        dev = self._dev
+        try:
+            return await self._call(command, params, timeout)
+        except (OSError, RuntimeError) as e:
+            error = e
+        for tier in range(_RECOVERY_TIERS):
+            if dev.debug:
+                print('DEBUG: call recovery tier', tier, 'after', error)
+            try:
+                if tier == _RECOVERY_RESYNC and dev._response_pending:
+                    dev._recoveries[tier] += 1
+                    return dev._reread_response(command)
+                if not dev._recover(tier):
+                    continue
+                return await self._call(command, params, timeout)
+            except (OSError, RuntimeError) as e:
+                error = e
+        dev.last_error = error
+        return None
+
+    async def _call(self, command, params, timeout):
+        """Async version of PN532._call: bus and protocol errors are raised
+        as OSError/RuntimeError."""
+        dev = self._dev
+        stats = dev._stats
+        stats.start(command)
+        dev._response_pending = False
+        try:
+            if not dev._send_command(command, params):
+                raise OSError('PN532 bus write failed')
+            stats.mark()
+            # The ACK follows within a millisecond or two, whatever the timeout.
+            if not await dev._wait_ready_async(min(timeout, _ACK_TIMEOUT)):
+                stats.mark()
+                raise RuntimeError('No ACK from PN532')
+            dev._read_ack()
+            stats.mark()
+            if not await dev._wait_ready_async(timeout):
+                dev._abort()
+                stats.mark()
+                stats.finish(_STAT_TIMEOUTS)
+                return None
+            stats.mark()
+            dev._response_pending = True
+            response = dev._read_response(command)
+            dev._response_pending = False
+        except asyncio.CancelledError:
+            dev._abort()
+            stats.finish()
+            raise
+        except Exception:
+            stats.finish(_STAT_ERRORS)
+            raise
+        stats.mark()
+        stats.finish(_status_counter(command, response))
+        return response
+
+    async def read_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1000):
+        """Async version of PN532.read_passive_target."""
+        response = await self.call(_COMMAND_INLISTPASSIVETARGET,
+                                   params=_poll_params(card_baud), timeout=timeout)
+        self._dev._note_target(response, card_baud)
+        return _passive_target_uid(response, card_baud)
+
+    async def wait_for_card(self, timeout=5000, card_baud=_MIFARE_ISO14443A):
+        """Async version of PN532.wait_for_card: other tasks keep running
+        while the PN532 polls for a card, and cancelling the task stops the
+        poll."""
+        if self._dev._passive_retries != 0xFF:
+            self._dev.set_max_retries(0xFF)
+        return await self.read_passive_target(card_baud, timeout)
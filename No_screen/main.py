@@ -1,7 +1,10 @@
-from machine import Pin, SPI
+from machine import Pin, SPI, lightsleep
 import NFC_PN532 as nfc
 import time
 
+# Boot-to-ready time is measured from here
+boot_start = time.ticks_ms()
+
 # --- NFC/SPI Setup ---
 spi = SPI(0,
           baudrate=1152000,
@@ -17,9 +20,9 @@ cs = Pin(17, Pin.OUT)
 cs.value(1)
 rst = Pin(20, Pin.OUT)
 rst.value(1)
-# IRQ pin is not used in this library's polling mode
-# irq = Pin(15, Pin.IN) 
-irq = None # Set to None
+# The PN532 pulls IRQ low when a response is ready, so the driver can sleep
+# instead of polling the bus. Set irq = None if GP15 is not wired.
+irq = Pin(15, Pin.IN, Pin.PULL_UP)
 
 scan_LED = Pin(2, Pin.OUT)
 scan_LED.value(0)
@@ -36,28 +39,60 @@ red_LED.value(0)
 # to connect the pin to ground when pressed.
 scan_button = Pin(14, Pin.IN, Pin.PULL_UP)
 write_button = Pin(13, Pin.IN, Pin.PULL_UP)
+# A button edge wakes the Pico from lightsleep; the press itself is still
+# read by polling in the main loop.
+for button in (scan_button, write_button):
+    button.irq(trigger=Pin.IRQ_FALLING, handler=lambda pin: None)
+
+# --- Power management ---
+# While idle the Pico light-sleeps for up to IDLE_SLEEP_MS at a time and the
+# PN532 is powered down with the RF field off; its next command wakes it.
+# The share of time spent awake is printed every DUTY_REPORT_MS.
+IDLE_SLEEP_MS = 100
+DUTY_REPORT_MS = 60000
+use_lightsleep = True
+asleep_ms = 0
+duty_start = time.ticks_ms()
+
+# How often to look again while only cards that already carry the UID
+# being cloned are on the reader
+CLONE_POLL_MS = 100
 
 # Variable to store the Block 0 data read from a card
 saved_block_0 = None
 
 # --- PN532 Initialization ---
 print("Initializing PN532...")
-pn532 = nfc.PN532(spi, cs, rst, irq)
-ic, ver, rev, support = pn532.get_firmware_version()
+pn532 = nfc.PN532(spi, cs, irq=irq, reset=rst)
+ic, ver, rev, support = pn532.firmware_version
 print('Found PN532 with firmware version: {}.{}'.format(ver, rev))
 pn532.SAM_configuration()
+print(f"PN532 up in {pn532.boot_ms} ms, ready "
+      f"{time.ticks_diff(time.ticks_ms(), boot_start)} ms after boot")
 
 
 def calculate_bcc(uid_bytes):
     """
-    Calculates the BCC (XOR checksum) for a 4-byte MIFARE UID.
+    Calculates the BCC (XOR checksum) of every cascade level of a 4, 7 or
+    10-byte MIFARE UID, as the card sends them during anticollision. Every
+    level but the last is the cascade tag 0x88 and 3 UID bytes.
+    Returns a bytearray with one BCC per level.
     """
-    if len(uid_bytes) != 4:
-        raise ValueError("UID must be 4 bytes long")
-    bcc = 0
-    for byte in uid_bytes:
-        bcc ^= byte
-    return bcc
+    if len(uid_bytes) not in (4, 7, 10):
+        raise ValueError("UID must be 4, 7 or 10 bytes long")
+    bccs = bytearray(len(uid_bytes) // 3)
+    last = len(bccs) - 1
+    for level in range(len(bccs)):
+        if level < last:
+            bcc = 0x88
+            part = uid_bytes[3 * level:3 * level + 3]
+        else:
+            bcc = 0
+            part = uid_bytes[3 * level:]
+        for byte in part:
+            bcc ^= byte
+        bccs[level] = bcc
+    return bccs
 
 
 def read_source_card_data(dev, timeout_ms=5000):
@@ -68,22 +103,26 @@ def read_source_card_data(dev, timeout_ms=5000):
     """
     print('Waiting for SOURCE card...')
     print('Present the card you want to CLONE.')
-    start = time.ticks_ms()
-    uid = None
-    while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
-        # Check for a card
-        uid = dev.read_passive_target(timeout=100)
-        if uid is not None:
-            # Card found, break out of the loop
-            break
-        time.sleep(0.1)
+    # The PN532 polls for the card itself and answers as soon as one is tapped
+    uid = dev.wait_for_card(timeout=timeout_ms)
 
     if not uid:
         print('CARD NOT FOUND')
         return None
         
     uid_string = "".join(["{:02X}".format(i) for i in uid])
-    print(f"Found source card with UID: {uid_string}")
+    family, caps = dev.card_info()
+    print(f"Found source card with UID: {uid_string} ({nfc.CARD_NAMES[family]})")
+
+    # Only a 4-byte UID MIFARE Classic can be cloned onto the magic cards, so
+    # don't spend round trips authenticating anything else.
+    if family != nfc.CARD_UNKNOWN and not caps & nfc.CAP_CLASSIC:
+        print(f"{nfc.CARD_NAMES[family]} found, not a MIFARE Classic. Nothing to clone.")
+        return None
+    if len(uid) != 4:
+        bccs = " ".join(["{:02X}".format(b) for b in calculate_bcc(uid)])
+        print(f"{len(uid)}-byte UID (cascade BCCs {bccs}) can't be cloned onto a 4-byte magic card.")
+        return None
 
     # Authenticate block 0 (or any block in sector 0) to read it.
     # We'll try a common default key, KEY_DEFAULT_B (all 0xFFs)
@@ -109,7 +148,7 @@ def read_source_card_data(dev, timeout_ms=5000):
     card_uid_part = block0_data[0:4]
     card_bcc_part = block0_data[4]
     
-    calculated_bcc = calculate_bcc(card_uid_part)
+    calculated_bcc = calculate_bcc(card_uid_part)[0]
     
     if card_bcc_part == calculated_bcc:
         print(f"BCC is valid! (Read: 0x{card_bcc_part:02X}, Calculated: 0x{calculated_bcc:02X})")
@@ -124,6 +163,28 @@ def read_source_card_data(dev, timeout_ms=5000):
     # --- END OF BCC CHECK ---
 
 
+def wait_for_clone_target(dev, clone_uid, timeout_ms):
+    """
+    Waits for a card to write clone_uid to and selects it. Cards that already
+    carry clone_uid (the source card left on the reader, or one written
+    earlier) are passed over, so with two cards in the field the other one
+    is used. Returns the UID of the card, or None on timeout.
+    """
+    start = time.ticks_ms()
+    while True:
+        remaining = timeout_ms - time.ticks_diff(time.ticks_ms(), start)
+        if remaining <= 0 or dev.wait_for_card(timeout=remaining) is None:
+            return None
+        targets = dev.list_targets()
+        for target in targets:
+            if target.uid != clone_uid:
+                if len(targets) > 1:
+                    print(f"{len(targets)} cards in the field, using target {target.tg}")
+                    dev.select_target(target)
+                return target.uid
+        time.sleep_ms(CLONE_POLL_MS)
+
+
 def write_data_to_clone(dev, block_data, timeout_ms=10000):
     """
     Waits for a programmable card and writes the saved block 0 data to it.
@@ -133,69 +194,98 @@ def write_data_to_clone(dev, block_data, timeout_ms=10000):
     print("Present your UID-MODIFIABLE (magic) card.")
 
     # Wait for a target card to appear
-    start_wait = time.ticks_ms()
-    target_uid = None
-    while time.ticks_diff(time.ticks_ms(), start_wait) < timeout_ms:
-        target_uid = dev.read_passive_target(timeout=100)
-        if target_uid is not None:
-            break
-        time.sleep(0.1)
+    target_uid = wait_for_clone_target(dev, bytearray(block_data[0:4]), timeout_ms)
 
     if not target_uid:
         print("No target card found to write to. Aborting.")
         red_LED.value(1)
         time.sleep(0.5)
         red_LED.value(0)
-        return
+        return False
 
     target_uid_string = "".join(["{:02X}".format(i) for i in target_uid])
     print(f"Found target card with UID: {target_uid_string}")
 
-    # For "Gen2" or "lab 401" cards, we can try a normal authentication
-    # and then a standard write command to block 0.
-    
-    print("Attempting to authenticate target card...")
-    # authenticate with the card's current key.
-    # For a blank/new magic card, this is often the default key.
-    if not dev.mifare_classic_authenticate_block(target_uid, 0, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B):
-        print("Failed to authenticate target card with default key.")
-        red_LED.value(1)
-        time.sleep(0.5)
-        red_LED.value(0)
-        return
-        
-    print("Target card authenticated. Attempting to write to Block 0...")
-    
-    # Now, try to write the saved block 0 data
-    if dev.mifare_classic_write_block(0, block_data):
-        print("SUCCESS! Block 0 written.")
+    # Gen1a cards are written through their unlock backdoor, "Gen2" or
+    # "lab 401" cards with a normal authentication and write to block 0.
+    # The write is checked by selecting the card again and reading block 0
+    # back, while it is still in the field.
+    print("Writing Block 0 and verifying...")
+    start = time.ticks_ms()
+    attempts = dev.mifare_classic_clone_block0(target_uid, block_data, nfc.MIFARE_CMD_AUTH_B, nfc.KEY_DEFAULT_B)
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    if attempts:
+        print(f"SUCCESS! Block 0 written and verified in {elapsed} ms ({attempts} attempt(s)).")
         print(f"Wrote data: {[hex(b) for b in block_data]}")
         green_LED.value(1)
         time.sleep(1)
         green_LED.value(0)
-        
         print("\n--- CLONE COMPLETE ---")
-        print("Verify the new UID by scanning it again (press Scan button).")
-    else:
-        print("Error: Failed to write to block 0.")
-        print("This may not be a 'Direct Write' card, or it may be faulty.")
-        red_LED.value(1)
-        time.sleep(1)
-        red_LED.value(0)
-        
+        return True
+    print("Error: Block 0 could not be written and verified.")
+    print("Check the default key, or this may not be a Gen1a or 'Direct Write' card.")
+    red_LED.value(1)
+    time.sleep(1)
+    red_LED.value(0)
+    return False
+
+
+def idle_sleep(ms):
+    """
+    Sleeps until a button is pressed or ms have passed, using lightsleep
+    where the port allows it, and counts the time slept.
+    """
+    global asleep_ms, use_lightsleep
+    start = time.ticks_ms()
+    if use_lightsleep:
+        try:
+            lightsleep(ms)
+        except Exception as e:
+            print("lightsleep unavailable, idling instead:", e)
+            use_lightsleep = False
+    if not use_lightsleep:
+        time.sleep_ms(ms)
+    asleep_ms += time.ticks_diff(time.ticks_ms(), start)
+
+
+def report_duty_cycle():
+    """
+    Prints the share of time the Pico and the PN532 were awake since the
+    last report, then starts counting afresh.
+    """
+    global asleep_ms, duty_start
+    total = time.ticks_diff(time.ticks_ms(), duty_start)
+    if total <= 0:
+        return
+    power_downs, down_ms = pn532.power_stats(reset=True)
+    print(f"Duty cycle: Pico awake {(total - asleep_ms) * 100 // total}%, "
+          f"PN532 awake {max(0, total - down_ms) * 100 // total}% "
+          f"({power_downs} power downs in {total // 1000} s)")
+    asleep_ms = 0
+    duty_start = time.ticks_ms()
+
 
 # --- Main Loop ---
 print("\n--- MIFARE 1K Cloner Ready (with BCC Check) ---")
 print("Press SCAN button to read from source card.")
 print("Press WRITE button to write to target card.")
+pn532.standby()
 while True:
+    if time.ticks_diff(time.ticks_ms(), duty_start) >= DUTY_REPORT_MS:
+        report_duty_cycle()
+
     # Check if the scan button is pressed
     if scan_button.value() == 0:
         time.sleep(0.1)  # Debounce delay
         print("\n--- READ SOURCE CARD ---")
         scan_LED.value(1)
 
-        scanned_data = read_source_card_data(pn532)
+        try:
+            scanned_data = read_source_card_data(pn532)
+        except Exception as e:
+            # The driver already tried to recover; give up on this scan only.
+            print("Scan error:", e)
+            scanned_data = None
         scan_LED.value(0)
         
         if scanned_data:
@@ -213,6 +303,7 @@ while True:
         # Wait for the button to be released
         while scan_button.value() == 0:
             pass
+        pn532.standby()
         print("\n--- Ready for next command ---")
 
     # Check if the write button is pressed
@@ -234,15 +325,23 @@ while True:
         else:
             data_string = "".join(["{:02X}".format(i) for i in saved_block_0])
             print(f"Writing data: {data_string}")
-            write_data_to_clone(pn532, saved_block_0)
+            try:
+                write_data_to_clone(pn532, saved_block_0)
+            except Exception as e:
+                # The driver already tried to recover; give up on this write only.
+                print("Write error:", e)
+                red_LED.value(1)
+                time.sleep(1)
+                red_LED.value(0)
             
         write_LED.value(0)
 
         # Wait for the button to be released
         while write_button.value() == 0:
             pass
+        pn532.standby()
         print("\n--- Ready for next command ---")
     
-    # A small delay to prevent the loop from running too fast
-    time.sleep(0.05)
+    # Sleep until the next button press
+    idle_sleep(IDLE_SLEEP_MS)
 
@@ -0,0 +1,40 @@
+"""CPython stand-in for MicroPython's ``framebuf``.
+
+Only what the SSD1306 driver uses is provided. Text is kept as a list of
+(x, y, string) so the host runner can show the screen contents as text.
+"""
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+last = None
+
+
+class FrameBuffer:
+    def __init__(self, buf, width, height, fmt, stride=None):
+        global last
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.texts = []
+        last = self
+
+    def fill(self, c):
+        self.texts = []
+
+    def pixel(self, x, y, c=None):
+        return 0 if c is None else None
+
+    def scroll(self, dx, dy):
+        pass
+
+    def text(self, string, x, y, c=1):
+        self.texts.append((x, y, string))
+
+    def lines(self):
+        """Screen text, one string per 8-pixel text row."""
+        rows = {}
+        for x, y, string in sorted(self.texts, key=lambda t: (t[1], t[0])):
+            rows.setdefault(y, []).append(string)
+        return [" ".join(rows[y]) for y in sorted(rows)]
@@ -0,0 +1,159 @@
+"""CPython stand-in for the MicroPython ``machine`` module.
+
+Pins are shared by number: every ``Pin(n)`` object sees the same level, so a
+simulated peripheral can watch the chip-select line the firmware drives and
+drive the IRQ line the firmware reads. SPI and I2C buses forward traffic to
+whatever device has been attached with :func:`attach_spi` / :func:`attach_i2c`.
+"""
+
+import threading
+import time
+
+_levels = {}
+_watchers = {}
+_handlers = {}
+_spi_devices = {}
+_i2c_devices = {}
+# Set by every pin interrupt, so lightsleep returns early like on the Pico
+_wake = threading.Event()
+
+
+def attach_spi(bus_id, device):
+    """Connect a simulated device to SPI bus ``bus_id``. The device must
+    provide ``transfer(out_bytes) -> in_bytes``."""
+    _spi_devices[bus_id] = device
+
+
+def attach_i2c(bus_id, device):
+    _i2c_devices[bus_id] = device
+
+
+def watch_pin(pin_id, callback):
+    """Call ``callback(level)`` whenever pin ``pin_id`` changes level."""
+    _watchers.setdefault(pin_id, []).append(callback)
+
+
+def drive_pin(pin_id, level):
+    """Set a pin level from the outside world (buttons, IRQ lines)."""
+    _set_level(pin_id, 1 if level else 0)
+
+
+def _set_level(pin_id, level):
+    old = _levels.get(pin_id, 1)
+    _levels[pin_id] = level
+    if old == level:
+        return
+    for callback in _watchers.get(pin_id, ()):
+        callback(level)
+    handler = _handlers.get(pin_id)
+    if handler is not None:
+        trigger, func = handler
+        if (level == 0 and trigger & Pin.IRQ_FALLING) or \
+                (level == 1 and trigger & Pin.IRQ_RISING):
+            _wake.set()
+            func(Pin(pin_id))
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self._id = pin_id
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if pull == Pin.PULL_UP:
+            _levels.setdefault(self._id, 1)
+        elif pull == Pin.PULL_DOWN:
+            _levels.setdefault(self._id, 0)
+        if value is not None:
+            _set_level(self._id, 1 if value else 0)
+
+    def value(self, level=None):
+        if level is None:
+            return _levels.get(self._id, 1)
+        _set_level(self._id, 1 if level else 0)
+
+    def __call__(self, level=None):
+        return self.value(level)
+
+    def on(self):
+        _set_level(self._id, 1)
+
+    def off(self):
+        _set_level(self._id, 0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            _handlers.pop(self._id, None)
+        else:
+            _handlers[self._id] = (trigger, handler)
+
+    def __repr__(self):
+        return "Pin({})".format(self._id)
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, bus_id, **kwargs):
+        self._id = bus_id
+
+    def init(self, **kwargs):
+        pass
+
+    def _transfer(self, out):
+        device = _spi_devices.get(self._id)
+        if device is None:
+            return bytes(len(out))
+        return device.transfer(bytes(out))
+
+    def write(self, buf):
+        self._transfer(buf)
+
+    def read(self, nbytes, write=0x00):
+        return self._transfer(bytes([write]) * nbytes)
+
+    def readinto(self, buf, write=0x00):
+        buf[:] = self._transfer(bytes([write]) * len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[:] = self._transfer(write_buf)
+
+
+class I2C:
+    def __init__(self, bus_id, **kwargs):
+        self._id = bus_id
+
+    def writeto(self, addr, buf, stop=True):
+        device = _i2c_devices.get(self._id)
+        if device is not None:
+            device.write(addr, bytes(buf))
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        device = _i2c_devices.get(self._id)
+        if device is not None:
+            device.write(addr, b"".join(bytes(b) for b in vector))
+        return 1
+
+
+def idle():
+    time.sleep(0.0001)
+
+
+def lightsleep(ms=None):
+    """Sleep until a pin interrupt fires or ms have passed."""
+    _wake.clear()
+    _wake.wait(None if ms is None else ms / 1000)
+
+
+def freq(hz=None):
+    return 150000000
@@ -0,0 +1,17 @@
+"""CPython stand-in for the MicroPython ``micropython`` module."""
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def mem_info(*args):
+    pass
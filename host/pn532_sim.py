@@ -0,0 +1,709 @@
+"""Simulated PN532 on an SPI bus, with virtual ISO14443A cards.
+
+The simulator speaks the same wire protocol the firmware driver produces:
+LSB-first bytes, the SPI status/data-write/data-read prefix byte, normal
+and extended information frames with LEN/LCS/DCS, ACK frames and a ready
+status that goes low on the IRQ line.
+"""
+
+import threading
+import time
+
+import machine
+
+_SPI_STATREAD = 0x02
+_SPI_DATAWRITE = 0x01
+_SPI_DATAREAD = 0x03
+
+_ACK = b"\x00\x00\xFF\x00\xFF\x00"
+_NACK = b"\x00\x00\xFF\xFF\x00\x00"
+
+_REVERSE = bytes(int("{:08b}".format(i)[::-1], 2) for i in range(256))
+
+# InDataExchange / InCommunicateThru status codes, and the MI (more
+# information) bit used for chaining
+STATUS_OK = 0x00
+STATUS_TIMEOUT = 0x01
+STATUS_AUTH_ERROR = 0x14
+STATUS_MI = 0x40
+
+# Most data bytes one InDataExchange carries each way
+_MAX_EXCHANGE = 262
+
+# Air time of one byte (8 bits and parity) at 106 kbps, in microseconds;
+# every InPSL bit rate step halves it.
+_BYTE_US_106 = 9 * 128 / 13.56
+
+
+def _reverse(data):
+    return bytes(_REVERSE[b] for b in data)
+
+
+def crc_a(data):
+    """ISO14443A CRC of ``data`` as two bytes, low byte first."""
+    crc = 0x6363
+    for b in data:
+        b = (b ^ crc) & 0xFF
+        b = (b ^ (b << 4)) & 0xFF
+        crc = (crc >> 8) ^ (b << 8) ^ (b << 3) ^ (b >> 4)
+    return bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+
+
+def _frame(payload):
+    """Wrap ``payload`` (TFI first) in a normal information frame, or an
+    extended one if it is longer than 254 bytes."""
+    length = len(payload)
+    if length < 0xFF:
+        head = bytes([0x00, 0x00, 0xFF, length, (-length) & 0xFF])
+    else:
+        head = bytes([0x00, 0x00, 0xFF, 0xFF, 0xFF, length >> 8, length & 0xFF,
+                      (-(length >> 8) - length) & 0xFF])
+    return head + payload + bytes([(-sum(payload)) & 0xFF, 0x00])
+
+
+class VirtualCard:
+    """Base ISO14443A target. Subclasses implement ``exchange`` (commands
+    sent through InDataExchange) and ``transceive`` (raw InCommunicateThru)."""
+
+    atqa = b"\x00\x04"
+    sak = 0x08
+    ats = None
+    felica = False
+    halted = False
+
+    def __init__(self, uid):
+        self.uid = bytes(uid)
+
+    def select(self):
+        """Called when the card is activated by InListPassiveTarget."""
+
+    def halt(self):
+        """Called on InRelease/InDeselect or when the card leaves the field."""
+
+    def exchange(self, data):
+        return self.transceive(data)
+
+    def transceive(self, data):
+        return STATUS_TIMEOUT, b""
+
+    def raw(self, data, bits):
+        """Frame sent by InCommunicateThru with the PN532's CRC generation
+        off; ``data`` carries its own CRC and the last byte only ``bits``
+        bits (0 meaning all 8). Cards don't answer anything they don't know."""
+        if bits or len(data) < 3 or crc_a(data[:-2]) != bytes(data[-2:]):
+            return STATUS_TIMEOUT, b""
+        return self.transceive(data[:-2])
+
+
+class MifareClassic1K(VirtualCard):
+    """MIFARE Classic 1K: 16 sectors of 4 blocks, keys in the trailers.
+
+    ``magic`` selects how block 0 may be rewritten: ``"direct"`` for
+    Gen2/direct-write cards, ``"gen1a"`` for cards with the unlock backdoor
+    and ``None`` for genuine cards."""
+
+    atqa = b"\x00\x04"
+    sak = 0x08
+
+    def __init__(self, uid, magic=None):
+        super().__init__(uid)
+        self.magic = magic
+        self.blocks = [bytearray(16) for _ in range(64)]
+        self.blocks[0][0:4] = self.uid[0:4]
+        bcc = 0
+        for b in self.uid[0:4]:
+            bcc ^= b
+        self.blocks[0][4] = bcc
+        self.blocks[0][5:8] = bytes([self.sak, self.atqa[1], self.atqa[0]])
+        for sector in range(16):
+            self.blocks[sector * 4 + 3][:] = (b"\xFF" * 6 + b"\xFF\x07\x80\x69" +
+                                             b"\xFF" * 6)
+        self.auth_sector = None
+        self.halted = False
+        self.unlocked = 0
+        self.backdoor_block = None
+
+    def select(self):
+        self.auth_sector = None
+        self.halted = False
+        self.unlocked = 0
+
+    def halt(self):
+        self.auth_sector = None
+        self.halted = True
+        self.unlocked = 0
+        self.backdoor_block = None
+
+    def raw(self, data, bits):
+        if self.magic == "gen1a":
+            if bits == 7 and bytes(data) == b"\x40" and self.halted:
+                self.unlocked = 1
+                return STATUS_OK, b"\x0A"
+            if not bits and bytes(data) == b"\x43" and self.unlocked == 1:
+                self.unlocked = 2
+                return STATUS_OK, b"\x0A"
+        if bits or len(data) < 3 or crc_a(data[:-2]) != bytes(data[-2:]):
+            return STATUS_TIMEOUT, b""
+        data = bytes(data[:-2])
+        if data == b"\x50\x00":
+            self.halt()
+            return STATUS_TIMEOUT, b""
+        if self.unlocked == 2:
+            if self.backdoor_block is not None and len(data) == 16:
+                self.blocks[self.backdoor_block][:] = data
+                if self.backdoor_block == 0:
+                    self._refresh_uid()
+                self.backdoor_block = None
+                return STATUS_OK, b"\x0A"
+            if len(data) == 2 and data[0] == 0xA0:
+                self.backdoor_block = data[1]
+                return STATUS_OK, b"\x0A"
+        return STATUS_TIMEOUT, b""
+
+    def _refresh_uid(self):
+        self.uid = bytes(self.blocks[0][0:4])
+
+    def exchange(self, data):
+        cmd = data[0]
+        if cmd in (0x60, 0x61):
+            block = data[1]
+            key = bytes(data[2:8])
+            trailer = self.blocks[(block // 4) * 4 + 3]
+            expected = trailer[0:6] if cmd == 0x60 else trailer[10:16]
+            if bytes(data[8:12]) != self.uid[0:4] or key != bytes(expected):
+                self.auth_sector = None
+                return STATUS_AUTH_ERROR, b""
+            self.auth_sector = block // 4
+            return STATUS_OK, b""
+        if cmd == 0x30:
+            block = data[1]
+            if self.auth_sector != block // 4:
+                return STATUS_AUTH_ERROR, b""
+            return STATUS_OK, bytes(self.blocks[block])
+        if cmd == 0xA0:
+            block = data[1]
+            if self.auth_sector != block // 4 or len(data) != 18:
+                return STATUS_AUTH_ERROR, b""
+            if block == 0 and self.magic != "direct":
+                return STATUS_TIMEOUT, b""
+            self.blocks[block][:] = data[2:18]
+            if block == 0:
+                self._refresh_uid()
+            return STATUS_OK, b""
+        return STATUS_TIMEOUT, b""
+
+
+class NTAG21x(VirtualCard):
+    """NTAG213/215/216 with READ, FAST_READ, WRITE and GET_VERSION."""
+
+    atqa = b"\x00\x44"
+    sak = 0x00
+    _SIZES = {213: (45, 0x0F, 0x12), 215: (135, 0x11, 0x3E),
+              216: (231, 0x13, 0x6D)}
+
+    def __init__(self, uid, model=215):
+        super().__init__(uid)
+        self.pages_total, self.storage_size, cc_size = self._SIZES[model]
+        self.pages = [bytearray(4) for _ in range(self.pages_total)]
+        uid = self.uid
+        bcc0 = 0x88 ^ uid[0] ^ uid[1] ^ uid[2]
+        bcc1 = uid[3] ^ uid[4] ^ uid[5] ^ uid[6]
+        self.pages[0][:] = bytes([uid[0], uid[1], uid[2], bcc0])
+        self.pages[1][:] = uid[3:7]
+        self.pages[2][:] = bytes([bcc1, 0x48, 0x00, 0x00])
+        self.pages[3][:] = bytes([0xE1, 0x10, cc_size, 0x00])
+        for page in range(4, self.pages_total):
+            self.pages[page][:] = bytes([page & 0xFF] * 4)
+
+    def _read16(self, start):
+        out = bytearray()
+        for i in range(4):
+            out += self.pages[(start + i) % self.pages_total]
+        return bytes(out)
+
+    def exchange(self, data):
+        cmd = data[0]
+        if cmd == 0x30:
+            if data[1] >= self.pages_total:
+                return STATUS_TIMEOUT, b""
+            return STATUS_OK, self._read16(data[1])
+        if cmd == 0xA2:
+            page = data[1]
+            if page < 2 or page >= self.pages_total or len(data) != 6:
+                return STATUS_TIMEOUT, b""
+            self.pages[page][:] = data[2:6]
+            return STATUS_OK, b""
+        return self.transceive(data)
+
+    def transceive(self, data):
+        cmd = data[0]
+        if cmd == 0x60:
+            return STATUS_OK, bytes([0x00, 0x04, 0x04, 0x02, 0x01, 0x00,
+                                     self.storage_size, 0x03])
+        if cmd == 0x3A:
+            start, end = data[1], data[2]
+            if start > end or end >= self.pages_total:
+                return STATUS_TIMEOUT, b""
+            return STATUS_OK, b"".join(bytes(p) for p in
+                                       self.pages[start:end + 1])
+        if cmd == 0x30:
+            return self.exchange(data)
+        return STATUS_TIMEOUT, b""
+
+
+class Type4Tag(VirtualCard):
+    """NFC Forum Type 4 tag (ISO14443-4, like an NTAG 424 DNA) with an NDEF
+    application holding the capability container E103 and the NDEF file
+    E104. ``max_read`` is the MLe announced in the capability container;
+    reads longer than 255 bytes need extended length APDUs."""
+
+    atqa = b"\x03\x44"
+    sak = 0x20
+    ats = b"\x77\x77\x71\x02\x80"
+    NDEF_APP = b"\xD2\x76\x00\x00\x85\x01\x01"
+
+    def __init__(self, uid, ndef=b"", max_read=0x0400, size=0x0800):
+        super().__init__(uid)
+        self.max_read = max_read
+        cc = bytes([0x00, 0x0F, 0x20, max_read >> 8, max_read & 0xFF,
+                    0x00, 0xFF, 0x04, 0x06, 0xE1, 0x04, size >> 8,
+                    size & 0xFF, 0x00, 0x00])
+        ndef_file = bytearray(size)
+        ndef_file[0:2] = bytes([len(ndef) >> 8, len(ndef) & 0xFF])
+        ndef_file[2:2 + len(ndef)] = ndef
+        self.files = {b"\xE1\x03": bytearray(cc), b"\xE1\x04": ndef_file}
+        self.apdus = []
+        self.select()
+
+    def select(self):
+        self.app_selected = False
+        self.file = None
+
+    def halt(self):
+        self.select()
+
+    @staticmethod
+    def _body(apdu):
+        """Return (data, le) of a short or extended length APDU."""
+        rest = apdu[4:]
+        if not rest:
+            return b"", 0
+        if rest[0] == 0 and len(rest) >= 3:  # extended length
+            if len(rest) == 3:
+                return b"", ((rest[1] << 8) | rest[2]) or 0x10000
+            lc = (rest[1] << 8) | rest[2]
+            return rest[3:3 + lc], 0
+        if len(rest) == 1:
+            return b"", rest[0] or 0x100
+        return rest[1:1 + rest[0]], 0
+
+    def exchange(self, apdu):
+        apdu = bytes(apdu)
+        self.apdus.append(apdu)
+        if len(apdu) < 4:
+            return STATUS_OK, b"\x67\x00"
+        ins, p1, p2 = apdu[1], apdu[2], apdu[3]
+        data, le = self._body(apdu)
+        if ins == 0xA4:  # SELECT
+            if p1 == 0x04 and data == self.NDEF_APP:
+                self.app_selected = True
+                return STATUS_OK, b"\x90\x00"
+            if p1 == 0x00 and self.app_selected and data in self.files:
+                self.file = data
+                return STATUS_OK, b"\x90\x00"
+            return STATUS_OK, b"\x6A\x82"
+        if self.file is None:
+            return STATUS_OK, b"\x69\x86"
+        contents = self.files[self.file]
+        offset = (p1 << 8) | p2
+        if ins == 0xB0:  # READ BINARY
+            if le > self.max_read:
+                return STATUS_OK, b"\x67\x00"
+            return STATUS_OK, bytes(contents[offset:offset + le]) + b"\x90\x00"
+        if ins == 0xD6:  # UPDATE BINARY
+            if offset + len(data) > len(contents):
+                return STATUS_OK, b"\x6B\x00"
+            contents[offset:offset + len(data)] = data
+            return STATUS_OK, b"\x90\x00"
+        return STATUS_OK, b"\x6D\x00"
+
+
+class FeliCaCard(VirtualCard):
+    """FeliCa card answering POLLING at 212 and 424 kbps."""
+
+    felica = True
+
+    def __init__(self, idm, pmm=b"\x01\x20\x22\x04\x27\x67\x4E\xFF",
+                 system_code=b"\x88\xB4"):
+        super().__init__(idm)
+        self.pmm = bytes(pmm)
+        self.system_code = bytes(system_code)
+
+    def polling_response(self, request_code):
+        """POL_RES for a POLLING command with ``request_code``."""
+        out = b"\x01" + self.uid + self.pmm
+        if request_code == 0x01:
+            out += self.system_code
+        return bytes([len(out) + 1]) + out
+
+
+class PN532Simulator:
+    """A PN532 in SPI mode. Attach it to the ``machine`` shim with
+    :meth:`attach`; put cards in the field with :meth:`place`."""
+
+    firmware = (0x32, 0x01, 0x06, 0x07)
+
+    def __init__(self, spi_bus=0, cs_pin=17, irq_pin=15, rst_pin=20,
+                 ack_delay_us=50, response_delay_us=300):
+        self.spi_bus = spi_bus
+        self.cs_pin = cs_pin
+        self.irq_pin = irq_pin
+        self.rst_pin = rst_pin
+        self.ack_delay_us = ack_delay_us
+        self.response_delay_us = response_delay_us
+        self.field = []
+        self.active = {}
+        self.max_retries = 0xFF
+        self.rf_on = False
+        self.registers = {0x6302: 0x80, 0x6303: 0x80, 0x633D: 0x00}
+        self.commands = []
+        self.spi_bytes = 0
+        self._lock = threading.RLock()
+        self._outbox = []
+        self._pending = None
+        self._last_response = None
+        self._rx = bytearray()
+        self._op = None
+        self._read_pos = 0
+        self._selected = False
+        self._timer = None
+        self.powered_down = False
+        self.power_downs = 0
+        self._power_down_pending = False
+        self._awake_at = 0.0
+        self.faults = []
+        self.stuck = False
+        self._chained = b""
+        self._more = b""
+        # InPSL bit rate (0 = 106 kbps ... 3 = 848 kbps) and the air time
+        # the current command adds to the response delay.
+        self.bitrate = 0
+        self._air_us = 0
+        self._pps_allowed = False
+
+    def attach(self):
+        machine.attach_spi(self.spi_bus, self)
+        machine.watch_pin(self.cs_pin, self._on_cs)
+        if self.rst_pin is not None:
+            machine.watch_pin(self.rst_pin, self._on_rst)
+        machine.drive_pin(self.irq_pin, 1)
+        return self
+
+    # --- field control ---------------------------------------------------
+    def place(self, card):
+        with self._lock:
+            self.field.append(card)
+            if self._pending is not None:
+                self._run(self._pending)
+
+    def remove(self, card=None):
+        with self._lock:
+            cards = self.field if card is None else [card]
+            for c in list(cards):
+                c.halt()
+                self.field.remove(c)
+                for tg, active in list(self.active.items()):
+                    if active is c:
+                        del self.active[tg]
+
+    def inject(self, fault):
+        """Make the next command go wrong, to exercise the driver's error
+        recovery. ``"drop"`` loses the command frame (no ACK), ``"garble"``
+        corrupts the response checksum (a NACK gets a good copy) and
+        ``"stuck"`` makes the chip ignore everything until a hardware reset."""
+        with self._lock:
+            self.faults.append(fault)
+
+    # --- bus side --------------------------------------------------------
+    def _on_rst(self, level):
+        if level == 0:
+            with self._lock:
+                self._outbox = []
+                self._pending = None
+                self.active = {}
+                self.stuck = False
+                self.powered_down = False
+                self._update_irq()
+
+    def _on_cs(self, level):
+        with self._lock:
+            if level == 0:
+                self._selected = True
+                self._op = None
+                if self.powered_down:
+                    # Any SPI traffic wakes the chip; this transaction is lost.
+                    self.powered_down = False
+                    self._awake_at = time.monotonic() + 0.001
+                    self._op = "wake"
+                self._rx = bytearray()
+                self._read_pos = 0
+                return
+            self._selected = False
+            if self._op == _SPI_DATAWRITE:
+                self._host_frame(bytes(self._rx))
+            elif self._op == _SPI_DATAREAD and self._read_pos > 0:
+                if self._outbox and self._ready():
+                    self._outbox.pop(0)
+                    # Reading a frame releases IRQ, even if another is queued.
+                    machine.drive_pin(self.irq_pin, 1)
+                    if self._power_down_pending and not self._outbox:
+                        self._power_down_pending = False
+                        self.powered_down = True
+                        self.power_downs += 1
+                self._update_irq()
+
+    def _ready(self):
+        return bool(self._outbox) and time.monotonic() >= self._outbox[0][0]
+
+    def transfer(self, out):
+        with self._lock:
+            self.spi_bytes += len(out)
+            data = _reverse(out)
+            reply = bytearray(len(data))
+            for i, byte in enumerate(data):
+                if self._op is None:
+                    self._op = byte
+                    continue
+                if self._op == _SPI_STATREAD:
+                    reply[i] = 0x01 if self._ready() else 0x00
+                elif self._op == _SPI_DATAWRITE:
+                    self._rx.append(byte)
+                elif self._op == _SPI_DATAREAD:
+                    if self._ready():
+                        frame = self._outbox[0][1]
+                        if self._read_pos < len(frame):
+                            reply[i] = frame[self._read_pos]
+                    self._read_pos += 1
+            return _reverse(reply)
+
+    def _queue(self, frame, delay_us):
+        ready_at = time.monotonic() + delay_us / 1e6
+        if self._outbox:
+            ready_at = max(ready_at, self._outbox[-1][0])
+        self._outbox.append((ready_at, frame))
+        self._update_irq()
+
+    def _update_irq(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._outbox:
+            machine.drive_pin(self.irq_pin, 1)
+            return
+        wait = self._outbox[0][0] - time.monotonic()
+        if wait <= 0:
+            machine.drive_pin(self.irq_pin, 0)
+        else:
+            machine.drive_pin(self.irq_pin, 1)
+            self._timer = threading.Timer(wait, self._irq_due)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _irq_due(self):
+        with self._lock:
+            self._timer = None
+            self._update_irq()
+
+    def _host_frame(self, raw):
+        if time.monotonic() < self._awake_at or self.stuck:
+            return  # still waking up, or hung
+        start = raw.find(b"\x00\xFF")
+        if start < 0:
+            return
+        body = raw[start + 2:]
+        if body[:3] == b"\x00\xFF\x00":
+            # ACK from the host aborts the command in progress.
+            self._pending = None
+            self._outbox = []
+            self._update_irq()
+            return
+        if body[:2] == b"\xFF\x00":
+            if self._last_response is not None:
+                self._queue(self._last_response, self.ack_delay_us)
+            return
+        if body[:2] == b"\xFF\xFF":
+            # Extended frame: LENm, LENl and LCS.
+            if (body[2] + body[3] + body[4]) & 0xFF:
+                return
+            length = (body[2] << 8) | body[3]
+            body = body[3:]
+        elif (body[0] + body[1]) & 0xFF:
+            return
+        else:
+            length = body[0]
+        if len(body) < length + 3:
+            return
+        payload = body[2:2 + length]
+        if (sum(payload) + body[2 + length]) & 0xFF or payload[0] != 0xD4:
+            return
+        fault = self.faults.pop(0) if self.faults else None
+        if fault == "drop":
+            return
+        if fault == "stuck":
+            self.stuck = True
+            return
+        self._queue(_ACK, self.ack_delay_us)
+        self.commands.append(payload[1])
+        self._run(payload[1:], garble=fault == "garble")
+
+    def _run(self, command, garble=False):
+        code, params = command[0], bytes(command[1:])
+        handler = getattr(self, "_cmd_{:02x}".format(code), None)
+        result = handler(params) if handler is not None else b""
+        if result is None:
+            # Command parked until something changes (card enters the field).
+            self._pending = command
+            return
+        self._pending = None
+        response = _frame(bytes([0xD5, code + 1]) + result)
+        self._last_response = response
+        if garble:
+            response = response[:-2] + bytes([response[-2] ^ 0xFF, 0x00])
+        self._queue(response, self.response_delay_us + self._air_us)
+        self._air_us = 0
+
+    def _air(self, count):
+        """Account for ``count`` bytes sent over the air at the current rate."""
+        self._air_us += count * _BYTE_US_106 / (1 << self.bitrate)
+
+    # --- command handlers --------------------------------------------------
+    def _cmd_02(self, params):  # GetFirmwareVersion
+        return bytes(self.firmware)
+
+    def _cmd_06(self, params):  # ReadRegister
+        return bytes(self.registers.get((params[i] << 8) | params[i + 1], 0)
+                     for i in range(0, len(params), 2))
+
+    def _cmd_08(self, params):  # WriteRegister
+        for i in range(0, len(params), 3):
+            self.registers[(params[i] << 8) | params[i + 1]] = params[i + 2]
+        return b""
+
+    def _cmd_16(self, params):  # PowerDown, once the response is read
+        self._power_down_pending = True
+        return b"\x00"
+
+    def _cmd_14(self, params):  # SAMConfiguration
+        return b""
+
+    def _cmd_32(self, params):  # RFConfiguration
+        if params[0] == 0x01:
+            self.rf_on = bool(params[1] & 0x01)
+            if not self.rf_on:
+                # Cards lose power and come back in their idle state.
+                for card in self.field:
+                    card.halt()
+                    card.select()
+                self.active = {}
+                self.bitrate = 0
+        elif params[0] == 0x05:
+            self.max_retries = params[3]
+        return b""
+
+    def _cmd_4a(self, params):  # InListPassiveTarget
+        max_tg = min(params[0], 2)
+        felica = params[1] in (0x01, 0x02)
+        # Targets from an earlier activation drop back to idle; halted cards
+        # ignore the REQA and stay out of the list.
+        for card in self.active.values():
+            card.halt()
+            card.select()
+        self.active = {}
+        self.bitrate = params[1] if felica else 0
+        self._pps_allowed = True
+        free = [card for card in self.field
+                if card.felica == felica and not card.halted]
+        if not free:
+            return None if self.max_retries == 0xFF else b"\x00"
+        self.rf_on = True
+        out = bytearray([0])
+        for tg, card in enumerate(free[:max_tg], 1):
+            card.select()
+            self.active[tg] = card
+            out[0] += 1
+            if felica:
+                out += bytes([tg]) + card.polling_response(params[5])
+                continue
+            out += bytes([tg]) + card.atqa + bytes([card.sak, len(card.uid)])
+            out += card.uid
+            if card.ats is not None:
+                out += bytes([len(card.ats) + 1]) + card.ats
+        return bytes(out)
+
+    def _cmd_4e(self, params):  # InPSL
+        card = self.active.get(params[0] & 0x0F)
+        if card is None:
+            return bytes([0x27])
+        rate = params[1]
+        if card.felica:
+            supported = rate in (0x01, 0x02)
+        else:
+            # TA(1) of the ATS lists the divisors the card takes each way.
+            ats = card.ats or b"\x00"
+            ta = ats[1] if ats[0] & 0x10 else 0
+            supported = rate == 0 or (ta >> 4) & ta & (1 << (rate - 1))
+        # ISO14443-4 cards take PPS only before the first exchange.
+        if params[1] != params[2] or not supported or not (card.felica or self._pps_allowed):
+            return bytes([0x01])
+        self.bitrate = rate
+        return bytes([0x00])
+
+    def _cmd_40(self, params):  # InDataExchange
+        card = self.active.get(params[0] & 0x0F)
+        if card is None:
+            return bytes([0x27])
+        self._pps_allowed = False
+        if params[0] & STATUS_MI:
+            # The host chains a long command; the card gets it once complete.
+            self._chained += params[1:]
+            return bytes([STATUS_OK])
+        command, self._chained = self._chained + params[1:], b""
+        if not command and self._more:
+            return self._next_part()
+        self._more = b""
+        status, data = card.exchange(command)
+        self._air(len(command) + len(data))
+        if status == STATUS_AUTH_ERROR:
+            card.halt()
+        if status == STATUS_OK and len(data) > _MAX_EXCHANGE:
+            self._more = data
+            return self._next_part()
+        return bytes([status]) + data
+
+    def _next_part(self):
+        """Next part of a long card response, with MI set if more follow."""
+        part, self._more = self._more[:_MAX_EXCHANGE], self._more[_MAX_EXCHANGE:]
+        return bytes([STATUS_MI if self._more else STATUS_OK]) + part
+
+    def _cmd_42(self, params):  # InCommunicateThru
+        card = next(iter(self.active.values()), None)
+        if card is None:
+            return bytes([0x27])
+        if self.registers[0x6302] & 0x80:
+            status, data = card.transceive(params)
+        else:
+            status, data = card.raw(params, self.registers[0x633D] & 0x07)
+        return bytes([status]) + data
+
+    def _cmd_44(self, params):  # InDeselect
+        return self._release(params)
+
+    def _cmd_52(self, params):  # InRelease
+        return self._release(params)
+
+    def _release(self, params):
+        tg = params[0] if params else 0
+        for key in list(self.active):
+            if tg in (0, key):
+                self.active.pop(key).halt()
+        return b"\x00"
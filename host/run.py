@@ -0,0 +1,167 @@
+"""Run the Pico firmware on the host against a simulated PN532.
+
+    python host/run.py Emulator --script host/scenarios/emulator_clone.txt
+
+The firmware directory is copied to a scratch directory (so saved lists don't
+touch the repo), the MicroPython stand-ins in this directory are put first on
+sys.path and main.py is run unmodified. A scenario script drives the buttons
+and the cards in the field, one command per line:
+
+    wait <ms>                     pause the script
+    press <button> [<ms>]         hold a button (name or GPIO number), 100 ms default
+    place classic <uid> [direct|gen1a]
+                                  put a MIFARE Classic 1K in the field
+    place ntag213|ntag215|ntag216 <uid>
+    place type4 <uid> [<bytes>]   put an NFC Forum Type 4 tag with an NDEF
+                                  message of that size (1024 default) in the field
+    place felica <idm>            put a FeliCa card in the field
+    remove                        take every card out of the field
+    quit                          stop the firmware and exit
+
+Lines starting with # are ignored. The OLED contents are printed whenever
+the screen is redrawn.
+"""
+
+import argparse
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import _thread
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BUTTONS = {
+    "Emulator": {"up": 14, "sel": 13, "down": 5},
+    "No_screen": {"scan": 14, "write": 13},
+}
+
+
+def install_time():
+    """Add the MicroPython ticks/sleep functions to the time module."""
+    if hasattr(time, "ticks_ms"):
+        return
+    start = time.monotonic_ns()
+    period = 0x40000000
+
+    def ticks_diff(end, begin):
+        diff = (end - begin) & (period - 1)
+        return diff - period if diff & (period >> 1) else diff
+
+    time.ticks_ms = lambda: ((time.monotonic_ns() - start) // 1000000) % period
+    time.ticks_us = lambda: ((time.monotonic_ns() - start) // 1000) % period
+    time.ticks_cpu = time.ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = lambda ticks, delta: (ticks + delta) % period
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+
+class Display:
+    """I2C device that prints the OLED text whenever the screen is shown."""
+
+    def __init__(self):
+        self._last = None
+
+    def write(self, addr, data):
+        import framebuf
+        if not data or data[0] != 0x40 or framebuf.last is None:
+            return
+        lines = framebuf.last.lines()
+        if lines != self._last:
+            self._last = lines
+            print("[OLED] " + " | ".join(lines))
+
+
+def make_card(kind, uid, extra):
+    import pn532_sim
+    uid = bytes.fromhex(uid)
+    if kind == "classic":
+        return pn532_sim.MifareClassic1K(uid, magic=extra[0] if extra else None)
+    if kind == "felica":
+        return pn532_sim.FeliCaCard(uid)
+    if kind.startswith("ntag"):
+        return pn532_sim.NTAG21x(uid, int(kind[4:]))
+    if kind == "type4":
+        size = int(extra[0]) if extra else 1024
+        return pn532_sim.Type4Tag(uid, bytes(i & 0xFF for i in range(size)))
+    raise ValueError("unknown card type " + kind)
+
+
+def run_script(lines, sim, buttons):
+    try:
+        play(lines, sim, buttons)
+    finally:
+        _thread.interrupt_main()
+
+
+def play(lines, sim, buttons):
+    """Carry out the scenario commands in lines, see the module docstring."""
+    import machine
+    for line in lines:
+        words = line.split()
+        if not words or words[0].startswith("#"):
+            continue
+        command, args = words[0], words[1:]
+        print("[script] " + line.strip())
+        if command == "wait":
+            time.sleep(int(args[0]) / 1000)
+        elif command == "press":
+            pin = buttons.get(args[0])
+            pin = int(args[0]) if pin is None else pin
+            machine.drive_pin(pin, 0)
+            time.sleep((int(args[1]) if len(args) > 1 else 100) / 1000)
+            machine.drive_pin(pin, 1)
+        elif command == "place":
+            sim.place(make_card(args[0], args[1], args[2:]))
+        elif command == "remove":
+            sim.remove()
+        elif command == "quit":
+            return
+        else:
+            raise ValueError("unknown script command " + command)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("firmware", help="firmware directory, e.g. Emulator")
+    parser.add_argument("--script", help="scenario file (default: run forever)")
+    args = parser.parse_args(argv)
+
+    source = os.path.abspath(args.firmware)
+    lines = None
+    if args.script:
+        with open(args.script) as f:
+            lines = f.readlines()
+    workdir = tempfile.mkdtemp(prefix="pico-")
+    for name in os.listdir(source):
+        if name.endswith((".py", ".json")):
+            shutil.copy(os.path.join(source, name), workdir)
+    os.chdir(workdir)
+    sys.path[:0] = [workdir, HOST_DIR]
+    install_time()
+
+    import machine
+    import pn532_sim
+    sim = pn532_sim.PN532Simulator().attach()
+    machine.attach_i2c(1, Display())
+    buttons = BUTTONS.get(os.path.basename(source.rstrip(os.sep)), {})
+    for pin in buttons.values():
+        machine.drive_pin(pin, 1)
+
+    if lines is not None:
+        threading.Thread(target=run_script, args=(lines, sim, buttons),
+                         daemon=True).start()
+    try:
+        runpy.run_path(os.path.join(workdir, "main.py"), run_name="__main__")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
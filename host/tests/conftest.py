@@ -0,0 +1,13 @@
+"""Put the MicroPython stand-ins and the Emulator firmware on sys.path, so
+the firmware modules can be imported by the tests as they are on the Pico."""
+
+import os
+import sys
+
+HOST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(HOST_DIR), "Emulator"))
+sys.path.insert(0, HOST_DIR)
+
+import run  # noqa: E402
+
+run.install_time()
@@ -0,0 +1,44 @@
+import time
+
+import NFC_PN532
+
+GETFIRMWAREVERSION = 0x02
+
+
+def test_average_survives_totals_past_32_bits(monkeypatch):
+    clock = [0]
+    monkeypatch.setattr(time, "ticks_us", lambda: clock[0])
+    monkeypatch.setattr(time, "ticks_diff", lambda end, begin: end - begin)
+    stats = NFC_PN532._CommandStats()
+    calls = 25000  # 25000 x 200 ms is 5e9 us, past 2**32
+    for _ in range(calls):
+        stats.start(GETFIRMWAREVERSION)
+        clock[0] += 200000
+        stats.mark()
+        stats.finish()
+    stats.start(GETFIRMWAREVERSION)
+    clock[0] += 200500
+    stats.mark()
+    stats.finish()
+    count, _, _, phases = stats.get(GETFIRMWAREVERSION)
+    assert count == calls + 1
+    low, avg, _, high = phases[0]
+    assert (low, high) == (200000, 200500)
+    assert avg == 200000
+    # Kept in MicroPython's small int range, so recording doesn't allocate
+    assert max(stats._total_ms) < 2 ** 30
+
+
+def test_average_after_halving(monkeypatch):
+    clock = [0]
+    monkeypatch.setattr(time, "ticks_us", lambda: clock[0])
+    monkeypatch.setattr(time, "ticks_diff", lambda end, begin: end - begin)
+    monkeypatch.setattr(NFC_PN532, "_STATS_TOTAL_MAX_MS", 1000)
+    stats = NFC_PN532._CommandStats()
+    for _ in range(50):
+        stats.start(GETFIRMWAREVERSION)
+        clock[0] += 70000
+        stats.mark()
+        stats.finish()
+    assert stats._total_ms[0] < 1000
+    assert stats.get(GETFIRMWAREVERSION)[3][0][1] == 70000
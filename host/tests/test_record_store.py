@@ -0,0 +1,51 @@
+import os
+
+from record_store import FLAG_MIGRATED, RecordStore
+
+BLOCK = "04a1b2c3d40804000000000000000000"
+
+
+def test_migrate_json_moves_list(tmp_path):
+    json_path = str(tmp_path / "saved_mifare.json")
+    with open(json_path, "w") as f:
+        f.write('["{}", [1, 2, 3], {}]'.format(
+            BLOCK, list(bytes.fromhex(BLOCK))))
+    store = RecordStore(str(tmp_path / "saved_mifare.bin"))
+    assert store.migrate_json(json_path) == 2
+    assert not os.path.exists(json_path)
+    assert [(flags, bytes(block).hex()) for _, flags, block in store.records()] \
+        == [(FLAG_MIGRATED, BLOCK)] * 2
+
+
+def test_migrate_json_keeps_corrupt_file(tmp_path, capsys):
+    json_path = str(tmp_path / "saved_mifare.json")
+    truncated = '["{}", "04a1b2'.format(BLOCK)
+    with open(json_path, "w") as f:
+        f.write(truncated)
+    store = RecordStore(str(tmp_path / "saved_mifare.bin"))
+    assert store.migrate_json(json_path) == 0
+    assert len(store) == 0
+    assert not os.path.exists(json_path)
+    with open(json_path + ".bad") as f:
+        assert f.read() == truncated
+    assert "saved_mifare.json" in capsys.readouterr().out
+    # Nothing left to bring in on the next boot
+    assert store.migrate_json(json_path) == 0
+
+
+def test_migrate_json_keeps_file_without_list(tmp_path):
+    json_path = str(tmp_path / "saved_ntag.json")
+    with open(json_path, "w") as f:
+        f.write('{"uid": "04112233445566"}')
+    store = RecordStore(str(tmp_path / "saved_ntag.bin"))
+    assert store.migrate_json(json_path) == 0
+    assert os.path.exists(json_path + ".bad")
+
+
+def test_migrate_json_drops_empty_file(tmp_path):
+    json_path = str(tmp_path / "saved_ntag.json")
+    open(json_path, "w").close()
+    store = RecordStore(str(tmp_path / "saved_ntag.bin"))
+    assert store.migrate_json(json_path) == 0
+    assert not os.path.exists(json_path)
+    assert not os.path.exists(json_path + ".bad")
@@ -0,0 +1,8 @@
+"""CPython stand-in for MicroPython's ``uasyncio``."""
+
+from asyncio import *  # noqa: F401,F403
+from asyncio import sleep
+
+
+async def sleep_ms(ms):
+    await sleep(ms / 1000)